@@ -0,0 +1,243 @@
+import math
+import numpy as np
+
+# racing lines for the AI. every ai_waypoints list is turned once into a
+# closed Catmull-Rom spline, sampled every `spacing` pixels along its
+# length, with the heading, the curvature and a target speed at every
+# sample. the target speed is what the grip allows in the corner, lowered
+# before corners so there is room to brake.
+#
+# while racing an AI car only looks at a few samples ahead of the one it
+# was closest to last step (kept in waypoint_index), steers to the heading
+# a bit further down the line, corrected for how far it is off the line,
+# and gives gas or brakes for the target speed there. the lines are kept
+# after each other in one set of arrays, so all AI cars are done in one
+# numpy pass whatever line they are on.
+#
+# WaypointAI is the old Car.update_ai for all AI cars at once: same
+# waypoints, same steering and gas, to the last bit, for big AI races.
+
+
+class RacingLine():
+    def __init__(self, waypoints, spacing=25, max_speed=2600, grip=2200, braking=900, subdivisions=16) -> None:
+        points = np.array(waypoints, dtype=np.float64)
+        # catmull-rom through every waypoint, the last one joins the first
+        p0 = np.roll(points, 1, axis=0)
+        p1 = points
+        p2 = np.roll(points, -1, axis=0)
+        p3 = np.roll(points, -2, axis=0)
+        t = np.linspace(0, 1, subdivisions, endpoint=False)[None, :, None]
+        curve = 0.5 * (2 * p1[:, None] + (p2 - p0)[:, None] * t +
+                       (2 * p0 - 5 * p1 + 4 * p2 - p3)[:, None] * t * t +
+                       (3 * p1 - p0 - 3 * p2 + p3)[:, None] * t * t * t)
+        curve = curve.reshape(-1, 2)
+
+        # the same curve with equal steps along its length
+        steps = np.sqrt((np.diff(np.vstack([curve, curve[:1]]), axis=0) ** 2).sum(axis=1))
+        distance = np.concatenate([[0], np.cumsum(steps)])
+        self.length = distance[-1]
+        count = int(self.length // spacing)
+        self.spacing = self.length / count
+        samples = np.arange(count) * self.spacing
+        closed = np.vstack([curve, curve[:1]])
+        self.points = np.column_stack([np.interp(samples, distance, closed[:, 0]),
+                                       np.interp(samples, distance, closed[:, 1])])
+        self.count = count
+
+        forward = np.roll(self.points, -1, axis=0) - np.roll(self.points, 1, axis=0)
+        self.heading = np.arctan2(forward[:, 1], forward[:, 0])
+        turn = (np.roll(self.heading, -1) - np.roll(self.heading, 1) + np.pi) % (2 * np.pi) - np.pi
+        self.curvature = turn / (2 * self.spacing)
+        # unit vector to the left of the line
+        self.normal = np.column_stack([-np.sin(self.heading), np.cos(self.heading)])
+
+        # v^2 * curvature <= grip, then brake in time for every corner
+        speed = np.minimum(max_speed, np.sqrt(grip / np.maximum(np.abs(self.curvature), 1e-9)))
+        for i in range(2):
+            for j in range(count - 1, -1, -1):
+                after = speed[(j + 1) % count]
+                speed[j] = min(speed[j], np.sqrt(after * after + 2 * braking * self.spacing))
+        self.speed = speed
+
+    def nearest(self, positions):
+        # closest sample for every position, searching the whole line
+        difference = positions[:, None, :] - self.points[None, :, :]
+        return (difference * difference).sum(axis=2).argmin(axis=1)
+
+
+class RacingLineAI():
+    def __init__(self, ai_waypoints, window=8, lookahead=4, lookahead_time=0.25, steer_gain=0.004,
+                 max_correction=0.6, turn_rate=0.05, lost_distance=600, field=None, wall_distance=120,
+                 wall_gain=0.5) -> None:
+        # one line per ai_type, the empty lists stay None
+        self.lines = [RacingLine(path) if len(path) > 2 else None for path in ai_waypoints]
+        # all lines after each other, so cars on different lines are done
+        # in the same pass. a car on line t uses samples offset[t] and up.
+        used = [line for line in self.lines if line is not None]
+        self.offset = np.zeros(len(self.lines), dtype=np.int64)
+        self.count = np.ones(len(self.lines), dtype=np.int64)
+        self.spacing = np.ones(len(self.lines))
+        start = 0
+        for ai_type, line in enumerate(self.lines):
+            if line is not None:
+                self.offset[ai_type] = start
+                self.count[ai_type] = line.count
+                self.spacing[ai_type] = line.spacing
+                start += line.count
+        self.points = np.vstack([line.points for line in used])
+        self.heading = np.concatenate([line.heading for line in used])
+        self.normal = np.vstack([line.normal for line in used])
+        self.speed = np.concatenate([line.speed for line in used])
+        # samples searched ahead of the last closest one
+        self.window = np.arange(-2, window)
+        self.lookahead = lookahead
+        self.lookahead_time = lookahead_time
+        self.steer_gain = steer_gain
+        self.max_correction = max_correction
+        # radians per step, the old AI turned 0.035
+        self.turn_rate = turn_rate
+        self.lost_distance = lost_distance
+        # a track_sdf.SignedDistanceField to steer away from walls that
+        # are closer than wall_distance, None to only follow the line
+        self.field = field
+        self.wall_distance = wall_distance
+        self.wall_gain = wall_gain
+
+    def update(self, world, dt):
+        # every AI car in the world, after the collisions of this step
+        count = world.count
+        cars = np.flatnonzero(world.is_ai[:count])
+        types = world.ai_type[cars]
+        known = np.array([line is not None for line in self.lines])[types]
+        if not known.all():
+            cars, types = cars[known], types[known]
+        if len(cars):
+            self.drive(world, cars, types, dt)
+
+    def drive(self, world, cars, types, dt):
+        rows = np.arange(len(cars))
+        offset = self.offset[types]
+        count = self.count[types]
+        position = world.position[cars]
+        index = world.waypoint_index[cars] % count
+
+        # closest sample in a small window ahead of the last one
+        window = (index[:, None] + self.window[None, :]) % count[:, None]
+        difference = position[:, None, :] - self.points[offset[:, None] + window]
+        distance = (difference * difference).sum(axis=2)
+        best = distance.argmin(axis=1)
+        closest = window[rows, best]
+        # cars that were pushed far away look along their whole line
+        for row in np.flatnonzero(distance[rows, best] > self.lost_distance * self.lost_distance):
+            closest[row] = self.lines[types[row]].nearest(position[row:row + 1])[0]
+        sample = offset + closest
+
+        # a car that makes no progress for 5 seconds is put back on the line
+        timer = np.where(closest != index, 5.0, world.teleport_timer[cars] - dt)
+        stuck = timer <= 0
+        angle = np.radians(world.angle[cars])
+        velocity = world.velocity[cars]
+        if stuck.any():
+            position[stuck] = self.points[sample[stuck]]
+            velocity[stuck] = 0
+            angle[stuck] = self.heading[sample[stuck]]
+            timer[stuck] = 5.0
+        world.teleport_timer[cars] = timer
+        world.waypoint_index[cars] = closest
+        world.position[cars] = position
+
+        speed = np.sqrt((velocity * velocity).sum(axis=1))
+        ahead = offset + (closest + self.lookahead +
+                          (speed * self.lookahead_time / self.spacing[types]).astype(np.int64)) % count
+
+        # heading of the line ahead, turned back towards the line
+        off_line = ((position - self.points[sample]) * self.normal[sample]).sum(axis=1)
+        correction = np.clip(off_line * self.steer_gain, -self.max_correction, self.max_correction)
+        target = self.heading[ahead] - correction
+        if self.field is not None:
+            # a target that drives into a near wall is turned towards
+            # running along it, harder the closer the wall is
+            distance, normal_x, normal_y = self.field.sample(position[:, 0], position[:, 1])
+            near = np.clip(1 - distance / self.wall_distance, 0, 1) * self.wall_gain
+            away = (np.arctan2(normal_y, normal_x) - target + np.pi) % (2 * np.pi) - np.pi
+            into = np.abs(away) > np.pi / 2
+            target += np.where(into, (away - np.sign(away) * np.pi / 2) * near, 0)
+        turn = (target - angle + np.pi) % (2 * np.pi) - np.pi
+        angle += np.clip(turn, -self.turn_rate, self.turn_rate)
+        world.angle[cars] = np.degrees(angle)
+
+        # gas below the target speed, brake well above it. same forces as
+        # "up" and "break" in Car.handle_user_input
+        target_speed = self.speed[ahead]
+        gas = (speed < target_speed) * (world.score[cars] + 15) * 60 / world.power_penalty[cars] * dt
+        velocity[:, 0] += np.cos(angle) * gas
+        velocity[:, 1] += np.sin(angle) * gas
+        brake = speed > target_speed * 1.1
+        if brake.any():
+            velocity[brake] *= (np.maximum(speed[brake] - 1000 * dt, 0) / speed[brake])[:, None]
+        world.velocity[cars] = velocity
+
+
+class WaypointAI():
+    def __init__(self, ai_waypoints, reach=400, turn_rate=0.035, teleport_time=5) -> None:
+        # every waypoint list padded to the longest one, the empty lists
+        # have length 0 and their cars are left alone
+        self.lengths = np.array([len(path) for path in ai_waypoints], dtype=np.int64)
+        self.points = np.zeros((len(ai_waypoints), max(self.lengths.max(initial=0), 1), 2))
+        for ai_type, path in enumerate(ai_waypoints):
+            if len(path):
+                self.points[ai_type, :len(path)] = path
+        self.reach = reach
+        self.turn_rate = turn_rate
+        self.teleport_time = teleport_time
+
+    def update(self, world, dt):
+        count = world.count
+        cars = np.flatnonzero(world.is_ai[:count])
+        types = world.ai_type[cars]
+        known = self.lengths[types] > 0
+        if not known.all():
+            cars, types = cars[known], types[known]
+        if len(cars):
+            self.drive(world, cars, types, dt)
+
+    def drive(self, world, cars, types, dt):
+        # the same operations in the same order as Car.update_ai, so every
+        # car ends up exactly where the scalar path puts it
+        car_angle = np.radians(world.angle[cars])
+        index = world.waypoint_index[cars]
+        next_waypoint = self.points[types, index]
+        position = world.position[cars]
+        difference = next_waypoint - position
+        timer = world.teleport_timer[cars] - dt
+
+        reached = np.sqrt(difference[:, 0] * difference[:, 0] + difference[:, 1] * difference[:, 1]) < self.reach
+        world.waypoint_index[cars] = np.where(reached, (index + 1) % self.lengths[types], index)
+        timer[reached] = self.teleport_time
+        world.teleport_timer[cars] = timer
+        # a car that reached no waypoint for a while is put on the one it
+        # was driving to
+        stuck = timer <= 0
+        if stuck.any():
+            position[stuck] = next_waypoint[stuck]
+            world.position[cars] = position
+
+        # numpy's arctan2 can be an ulp off math.atan2, and the angle is
+        # used as is when the car is close to it
+        target_angle = np.fromiter(map(math.atan2, difference[:, 0].tolist(), difference[:, 1].tolist()),
+                                   dtype=np.float64, count=len(cars))
+        target = -target_angle + math.pi * 0.5
+        # car.lerp for every car
+        dist = (target - car_angle + math.pi) % (2 * math.pi) - math.pi
+        step = np.where(dist < 0, -self.turn_rate, self.turn_rate)
+        angle = np.where(np.abs(dist) <= self.turn_rate, target, car_angle + step)
+        angle = np.degrees(angle)
+        world.angle[cars] = angle
+
+        # Car.handle_user_input("up") with the new angle
+        angle = np.radians(angle)
+        acceleration = (world.score[cars] + 15) * 60 / world.power_penalty[cars]
+        velocity = world.velocity[cars]
+        velocity[:, 0] += np.cos(angle) * acceleration * dt
+        velocity[:, 1] += np.sin(angle) * acceleration * dt
+        world.velocity[cars] = velocity
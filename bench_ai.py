@@ -0,0 +1,62 @@
+import random
+import time
+from track import get_track
+from car import Car, CarWorld
+from ai_path import RacingLineAI, WaypointAI
+
+# per step cost of driving a field of AI cars: Car.update_ai once per car
+# against WaypointAI (the same driving) and RacingLineAI for all of them in
+# one go. the cars are spread over the racing lines of all waypoint sets.
+# run with: python bench_ai.py
+
+dt = 1 / 60
+steps = 120
+
+
+def make_field(amount, ai_waypoints):
+    random.seed(0)
+    world = CarWorld(capacity=amount)
+    players = []
+    for i in range(amount):
+        ai_type = i % (len(ai_waypoints) - 1) + 1
+        x, y = random.choice(ai_waypoints[ai_type])
+        players.append(Car(world, position=[x + random.uniform(-100, 100), y + random.uniform(-100, 100)],
+                           angle=random.uniform(0, 360), is_ai=True, ai_type=ai_type))
+    return world, players
+
+
+def time_steps(function):
+    start = time.perf_counter()
+    for i in range(steps):
+        function()
+    return (time.perf_counter() - start) / steps
+
+
+def main():
+    ai_waypoints = get_track().ai_waypoints
+    batch = WaypointAI(ai_waypoints)
+    racing_line = RacingLineAI(ai_waypoints)
+    print(f"{'cars':>6} {'update_ai ms':>13} {'batch ms':>9} {'speedup':>8} {'racing line ms':>15} {'speedup':>8}")
+    for amount in [4, 32, 256, 1024]:
+        world, players = make_field(amount, ai_waypoints)
+
+        def scalar():
+            for player in players:
+                player.update_ai(dt, ai_waypoints)
+        scalar_time = time_steps(scalar)
+
+        scalar_world = world
+
+        world, players = make_field(amount, ai_waypoints)
+        batch_time = time_steps(lambda: batch.update(world, dt))
+        # the batch path has to drive exactly like update_ai
+        assert world.state() == scalar_world.state()
+
+        world, players = make_field(amount, ai_waypoints)
+        line_time = time_steps(lambda: racing_line.update(world, dt))
+        print(f"{amount:>6} {scalar_time * 1000:>13.3f} {batch_time * 1000:>9.3f} {scalar_time / batch_time:>7.1f}x"
+              f" {line_time * 1000:>15.3f} {scalar_time / line_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import random
+import time
+import numpy as np
+from src.game_data import walls, ai_waypoints
+from collision import aabb_circle, sphere_sphere, WallGrid, CarHash
+from track_compiler import load_compiled_walls, row_spacing
+from numpy_collision import NumpyWalls
+from track_sdf import SignedDistanceField
+
+# compares the per-frame cost of the wall collision for a field of cars:
+# the old linear scan over every wall against the WallGrid query, over the
+# raw spans and over the merged rectangles from track_compiler, and the
+# all cars x all walls numpy pass, and one lookup per car in the signed
+# distance field from track_sdf. the field finds close to, not exactly,
+# the same cars touching a wall, so both counts are printed next to the
+# car-wall contacts. then the car against car contacts: every car against
+# every other car against the CarHash pairs.
+# run with: python bench_collision.py
+
+scale = 12
+radius = 40.0
+frames = 60
+
+
+def linear_scan(walls, cars):
+    hits = 0
+    for x, y in cars:
+        for wall in walls:
+            if aabb_circle(wall.position[0], wall.position[1], wall.size[0], wall.size[1], x, y, radius) != False:
+                hits += 1
+    return hits
+
+
+def grid_scan(grid, cars):
+    hits = 0
+    for x, y in cars:
+        for wall in grid.query(x, y, radius * 2):
+            if aabb_circle(wall.position[0], wall.position[1], wall.size[0], wall.size[1], x, y, radius) != False:
+                hits += 1
+    return hits
+
+
+def numpy_scan(collider, cars):
+    px = np.array([x for x, y in cars])
+    py = np.array([y for x, y in cars])
+    depth = collider.penetration(px, py, np.full(len(cars), radius))[0]
+    return int((depth > 0).sum())
+
+
+def cars_hit(collider, cars):
+    # cars touching any wall, what sdf_scan counts
+    px = np.array([x for x, y in cars])
+    py = np.array([y for x, y in cars])
+    depth = collider.penetration(px, py, np.full(len(cars), radius))[0]
+    return int((depth > 0).any(axis=1).sum())
+
+
+def sdf_scan(field, cars):
+    px = np.array([x for x, y in cars])
+    py = np.array([y for x, y in cars])
+    depth = field.penetration(px, py, np.full(len(cars), radius))[0]
+    return int((depth > 0).sum())
+
+
+def all_pairs(cars):
+    hits = 0
+    for i, (x, y) in enumerate(cars):
+        for j, (x1, y1) in enumerate(cars):
+            if i != j and sphere_sphere(x, y, radius * 1.25, x1, y1, radius * 1.25):
+                hits += 1
+    return hits // 2
+
+
+def hashed_pairs(car_hash, cars):
+    hits = 0
+    for i, j in car_hash.pairs(cars):
+        if sphere_sphere(cars[i][0], cars[i][1], radius * 1.25, cars[j][0], cars[j][1], radius * 1.25):
+            hits += 1
+    return hits
+
+
+def crowded_grid(amount):
+    # a packed starting grid, two cars wide
+    return [(4630 + 90 * (i // 2) + random.uniform(-10, 10), 875 - 100 * (i % 2)) for i in range(amount)]
+
+
+def random_cars(amount):
+    # cars spread around the racing lines, with some of them touching walls
+    waypoints = [point for path in ai_waypoints for point in path]
+    cars = []
+    for i in range(amount):
+        x, y = random.choice(waypoints)
+        cars.append((x + random.uniform(-300, 300), y + random.uniform(-300, 300)))
+    return cars
+
+
+def time_frames(function, *args):
+    start = time.perf_counter()
+    for i in range(frames):
+        result = function(*args)
+    return (time.perf_counter() - start) / frames, result
+
+
+def main():
+    random.seed(0)
+    compiled = load_compiled_walls(walls)
+    for wall in walls + compiled:
+        wall.position[0] *= scale
+        wall.position[1] *= scale
+        wall.size[0] *= scale
+        wall.size[1] *= scale
+    grid = WallGrid(walls)
+    compiled_grid = WallGrid(compiled, row_spacing=row_spacing * scale)
+    numpy_walls = NumpyWalls(compiled, row_spacing=row_spacing * scale)
+    field = SignedDistanceField(compiled, row_spacing=row_spacing * scale)
+
+    print(f"{len(walls)} walls, {len(grid.cells)} grid cells")
+    print(f"{len(compiled)} merged walls, {len(compiled_grid.cells)} grid cells")
+    print(f"{'cars':>6} {'linear ms':>12} {'grid ms':>12} {'merged ms':>12} {'numpy ms':>12} {'sdf ms':>12}"
+          f" {'speedup':>10} {'hits':>6} {'cars hit':>9} {'sdf cars':>9}")
+    for amount in [4, 32, 256]:
+        cars = random_cars(amount)
+        linear_time, linear_hits = time_frames(linear_scan, walls, cars)
+        grid_time, grid_hits = time_frames(grid_scan, grid, cars)
+        compiled_time, compiled_hits = time_frames(grid_scan, compiled_grid, cars)
+        numpy_time, numpy_hits = time_frames(numpy_scan, numpy_walls, cars)
+        sdf_time, sdf_hits = time_frames(sdf_scan, field, cars)
+        assert linear_hits == grid_hits == compiled_hits == numpy_hits
+        print(f"{amount:>6} {linear_time * 1000:>12.3f} {grid_time * 1000:>12.3f} {compiled_time * 1000:>12.3f}"
+              f" {numpy_time * 1000:>12.3f} {sdf_time * 1000:>12.3f} {linear_time / compiled_time:>9.1f}x"
+              f" {linear_hits:>6} {cars_hit(numpy_walls, cars):>9} {sdf_hits:>9}")
+
+    car_hash = CarHash(radius * 2.5)
+    print()
+    print(f"{'cars':>6} {'all pairs ms':>14} {'hash ms':>12} {'speedup':>10}")
+    for amount in [50, 100, 200]:
+        cars = crowded_grid(amount)
+        all_time, all_hits = time_frames(all_pairs, cars)
+        hash_time, hash_hits = time_frames(hashed_pairs, car_hash, cars)
+        assert all_hits == hash_hits
+        print(f"{amount:>6} {all_time * 1000:>14.3f} {hash_time * 1000:>12.3f} {all_time / hash_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
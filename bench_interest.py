@@ -0,0 +1,83 @@
+import time
+from car import Car, CarWorld
+from simulation import Simulation
+from track import get_track
+from interest import InterestGrid, ClientView
+import protocol
+
+# what interest management saves for big rooms. every car in a simulated
+# AI race has a client that acknowledges every snapshot; the snapshots are
+# encoded once with every car for every client and once with only the
+# cars from the InterestGrid. reports bytes per client per second and the
+# encode time of one snapshot for all clients together.
+# run with: python bench_interest.py
+
+seconds = 10
+snapshot_rate = 20
+
+
+def spread_race(cars, track):
+    # cars spread out over the racing lines instead of on the starting grid
+    ai_waypoints = track.ai_waypoints
+    world = CarWorld(capacity=cars)
+    players = []
+    for i in range(cars):
+        ai_type = i % (len(ai_waypoints) - 1) + 1
+        path = ai_waypoints[ai_type]
+        waypoint = (i * 7) % len(path)
+        players.append(Car(world, position=list(path[waypoint]), angle=-180, car_type=i % 4,
+                           is_ai=True, ai_type=ai_type))
+        players[-1].waypoint_index = (waypoint + 1) % len(path)
+    return world, Simulation(world, players, track.collider(), track.finishline, ai_waypoints)
+
+
+def run(cars, interest, track):
+    world, simulation = spread_race(cars, track)
+    quantizer = protocol.Quantizer()
+    views = [ClientView() for i in range(cars)]
+    receivers = [protocol.Snapshots(quantizer) for i in range(cars)]
+    every = round(1 / simulation.timestep / snapshot_rate)
+    everyone = list(range(cars))
+    sent = 0
+    encode_time = 0
+    snapshots = 0
+    for step in range(int(seconds / simulation.timestep)):
+        simulation.step()
+        if simulation.tick % every:
+            continue
+        snapshots += 1
+        tick = simulation.tick
+        states = quantizer.quantize(world, cars, [0] * cars, [0] * cars)
+        start = time.perf_counter()
+        messages = []
+        if interest is not None:
+            interest.build(world.position[:cars].tolist())
+        for car, view in enumerate(views):
+            if interest is None:
+                relevant, keep = everyone, ()
+            else:
+                relevant, keep = interest.relevant(car, snapshots)
+            base_tick, base, seen, check = view.next_view(tick, states, relevant, keep)
+            messages.append(protocol.encode_delta(tick, seen, base_tick, base, quantizer.angle_steps, check))
+        encode_time += time.perf_counter() - start
+        for car, data in enumerate(messages):
+            sent += len(data)
+            received = receivers[car].apply(*protocol.decode(protocol.split_frames(bytearray(data))[0])[1])
+            assert received == views[car].history[tick]
+            views[car].acknowledge(tick)
+    return sent / seconds / cars, encode_time / snapshots
+
+
+def main():
+    track = get_track()
+    print(f"{snapshot_rate} snapshots/s, every car has a client")
+    print(f"{'cars':>6} {'all B/s':>10} {'nearby B/s':>11} {'all ms':>8} {'nearby ms':>10} {'saved':>7}")
+    for cars in [8, 32, 64, 128]:
+        all_bytes, all_time = run(cars, None, track)
+        nearby_bytes, nearby_time = run(cars, InterestGrid(), track)
+        print(f"{cars:>6} {all_bytes:>10.0f} {nearby_bytes:>11.0f} {all_time * 1000:>8.2f} {nearby_time * 1000:>10.2f}"
+              f" {(1 - nearby_bytes / all_bytes) * 100:>6.0f}%")
+
+
+if __name__ == "__main__":
+    main()
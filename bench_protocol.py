@@ -0,0 +1,118 @@
+import random
+import time
+from car import Car, CarWorld
+from simulation import Simulation
+from track import get_track
+import protocol
+
+# compares the binary state message from protocol.py with the text lines
+# it replaced. the text lines carry the same fields as the binary message,
+# written with the precision the text server used. reports encode and
+# decode time and bytes per tick for rooms of different sizes. then a
+# simulated 8 car race at 60 Hz, where some cars stand still, to see what
+# the quantized deltas send per client per second.
+# run with: python bench_protocol.py
+
+repeats = 2000
+
+
+def encode_text(tick, world, count, bits, sequences):
+    position = world.position[:count].tolist()
+    velocity = world.velocity[:count].tolist()
+    angle = world.angle[:count].tolist()
+    cars = ";".join(f"{position[i][0]:.1f},{position[i][1]:.1f},{velocity[i][0]:.1f},{velocity[i][1]:.1f},"
+                    f"{angle[i]:.1f},{bits[i]},{sequences[i]}" for i in range(count))
+    return f"state {tick} {cars}\n".encode()
+
+
+def decode_text(data):
+    _, tick, cars = data.decode().split(" ", 2)
+    values = [car.split(",") for car in cars.strip().split(";")]
+    return int(tick), [(float(x), float(y), float(vx), float(vy), float(angle), int(bits), int(sequence))
+                       for x, y, vx, vy, angle, bits, sequence in values]
+
+
+def decode_binary(data):
+    # (tick, cars) like decode_text
+    return protocol.decode(protocol.split_frames(bytearray(data))[0])[1]
+
+
+def make_room(count):
+    world = CarWorld(capacity=count)
+    for i in range(count):
+        Car(world, position=[random.uniform(0, 15000), random.uniform(0, 8000)],
+            angle=random.uniform(-360, 360))
+        world.velocity[i] = [random.uniform(-900, 900), random.uniform(-900, 900)]
+    bits = [random.randrange(32) for i in range(count)]
+    sequences = [random.randrange(100000) for i in range(count)]
+    return world, bits, sequences
+
+
+def time_repeats(function, *args):
+    start = time.perf_counter()
+    for i in range(repeats):
+        result = function(*args)
+    return (time.perf_counter() - start) / repeats, result
+
+
+def race_bandwidth(cars, parked, seconds, rate):
+    # bytes per client per second of a race snapshotted `rate` times a
+    # second, the client acknowledges every snapshot
+    track = get_track()
+    ai_waypoints = track.ai_waypoints
+    world = CarWorld(capacity=cars)
+    players = []
+    for i, position in enumerate(track.spawn_grid(cars)):
+        players.append(Car(world, position=position, angle=-180, car_type=i % 4,
+                           is_ai=i >= parked, ai_type=i % (len(ai_waypoints) - 1) + 1))
+    simulation = Simulation(world, players, track.collider(),
+                            track.finishline, ai_waypoints)
+    quantizer = protocol.Quantizer()
+    snapshots = protocol.Snapshots(quantizer)
+    bits = [0] * cars
+    sequences = [0] * cars
+    every = max(1, round(1 / simulation.timestep / rate))
+    sent = {"binary": 0, "quantized": 0, "delta": 0}
+    base_tick, base = 0, None
+    encode_time = 0
+    for i in range(int(seconds / simulation.timestep)):
+        simulation.step()
+        if simulation.tick % every:
+            continue
+        tick = simulation.tick
+        sent["binary"] += len(protocol.encode_state(tick, world, cars, bits, sequences))
+        quantized = quantizer.quantize(world, cars, bits, sequences)
+        sent["quantized"] += len(protocol.encode_delta(tick, quantized))
+        start = time.perf_counter()
+        data = protocol.encode_delta(tick, quantized, base_tick, base, quantizer.angle_steps)
+        encode_time += time.perf_counter() - start
+        sent["delta"] += len(data)
+        received = snapshots.apply(*protocol.decode(protocol.split_frames(bytearray(data))[0])[1])
+        assert received == quantized
+        base_tick, base = tick, quantized
+    return {name: value / seconds for name, value in sent.items()}, encode_time / (seconds * rate)
+
+
+def main():
+    random.seed(0)
+    print(f"{'cars':>6} {'format':>7} {'bytes':>7} {'encode us':>10} {'decode us':>10} {'KiB/s at 60 Hz':>15}")
+    for count in [2, 8, 32]:
+        world, bits, sequences = make_room(count)
+        for name, encode, decode in [("text", encode_text, decode_text),
+                                     ("binary", protocol.encode_state, decode_binary)]:
+            encode_time, data = time_repeats(encode, 12345, world, count, bits, sequences)
+            decode_time, result = time_repeats(decode, data)
+            assert len(result[1]) == count
+            print(f"{count:>6} {name:>7} {len(data):>7} {encode_time * 1e6:>10.1f} {decode_time * 1e6:>10.1f}"
+                  f" {len(data) * 60 / 1024:>15.1f}")
+
+    print()
+    print(f"{'cars':>6} {'parked':>7} {'rate':>5} {'binary B/s':>11} {'quantized B/s':>14} {'delta B/s':>10} {'delta encode us':>16}")
+    for cars, parked, rate in [(8, 0, 60), (8, 4, 60), (8, 0, 20)]:
+        sent, encode_time = race_bandwidth(cars, parked, 20, rate)
+        print(f"{cars:>6} {parked:>7} {rate:>5} {sent['binary']:>11.0f} {sent['quantized']:>14.0f}"
+              f" {sent['delta']:>10.0f} {encode_time * 1e6:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# the camera follows one car and decides what is worth drawing. anything
+# further than `margin` outside the 1280x720 view is skipped, and the
+# skipped draw calls are counted per frame.
+
+
+class Camera():
+    def __init__(self, width=1280, height=720, margin=64) -> None:
+        self.width = width
+        self.height = height
+        self.margin = margin
+        # offset added to world positions to get screen positions
+        self.position = (0, 0)
+        self.drawn = 0
+        self.skipped = 0
+        self.last_drawn = 0
+        self.last_skipped = 0
+
+    def follow(self, target):
+        self.position = (-target[0] + self.width / 2, -
+                         target[1] + self.height / 2)
+
+    def new_frame(self):
+        self.last_drawn = self.drawn
+        self.last_skipped = self.skipped
+        self.drawn = 0
+        self.skipped = 0
+
+    def is_visible(self, x, y, radius):
+        # world position with the size of what is drawn there
+        screen_x = x + self.position[0]
+        screen_y = y + self.position[1]
+        reach = radius + self.margin
+        if screen_x + reach < 0 or screen_x - reach > self.width or \
+                screen_y + reach < 0 or screen_y - reach > self.height:
+            self.skipped += 1
+            return False
+        self.drawn += 1
+        return True
@@ -0,0 +1,299 @@
+import math
+import numpy as np
+from collision import dot_product, length, normalize, point_aabb, sphere_sphere
+
+# car physics without any pygame. the state of every car lives in one
+# CarWorld as packed numpy arrays (struct of arrays) and Car objects are
+# thin views onto one row of it, so the per-car code keeps working while
+# the hot parts run over all cars at once.
+
+
+def mix(v, w, i):
+    return v * (1 - i) + w * i
+
+
+def lerp(a, b, i):
+    dist = b - a
+    dist = (dist + math.pi) % (2 * math.pi) - math.pi
+    step = i
+    if abs(dist) <= step:
+        return b
+    else:
+        if dist < 0:
+            step = -step
+        a += step
+    return a
+
+
+def get_lerp_step(a, b, i):
+    dist = b - a
+    dist = (dist + math.pi) % (2 * math.pi) - math.pi
+    step = i
+    if abs(dist) <= step:
+        return -b
+    else:
+        if dist < 0:
+            step = -step
+        return step
+
+
+def play_collision_sound(sounds, name, players, position):
+    # sounds is None when running without pygame (server, tests, replays)
+    if sounds is None:
+        return
+    dist_from_camera = length(
+        ((players[0].position[0]) - position[0], (players[0].position[1]) - position[1])) * 0.005
+    dist_from_camera = max(1, min(dist_from_camera, 5)) / 10
+    sounds[name].set_volume(0.6 - dist_from_camera)
+    sounds[name].play()
+
+
+class CarWorld():
+    # name: (dtype, columns)
+    fields = {
+        "position": (np.float64, 2),
+        "velocity": (np.float64, 2),
+        "angle": (np.float64, 1),
+        "angular_velocity": (np.float64, 1),
+        "radius": (np.float64, 1),
+        "drag": (np.float64, 1),
+        "angular_drag": (np.float64, 1),
+        "power_penalty": (np.float64, 1),
+        "teleport_timer": (np.float64, 1),
+        "score": (np.int64, 1),
+        "waypoint_index": (np.int64, 1),
+        "car_type": (np.int64, 1),
+        "ai_type": (np.int64, 1),
+        "is_ai": (np.bool_, 1),
+        "on_finishline": (np.bool_, 1),
+    }
+
+    def __init__(self, capacity=8) -> None:
+        self.count = 0
+        self.capacity = capacity
+        for name, (dtype, columns) in self.fields.items():
+            shape = (capacity, columns) if columns > 1 else (capacity,)
+            setattr(self, name, np.zeros(shape, dtype=dtype))
+
+    def grow(self, capacity):
+        for name in self.fields:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    @classmethod
+    def state_size(cls, count):
+        return sum(np.dtype(dtype).itemsize * columns * count for dtype, columns in cls.fields.values())
+
+    def state(self):
+        # every field of every car as bytes, for replays
+        return b"".join(getattr(self, name)[:self.count].tobytes() for name in self.fields)
+
+    def load_state(self, data):
+        # the other way around, the cars have to be added already
+        offset = 0
+        for name, (dtype, columns) in self.fields.items():
+            array = getattr(self, name)
+            size = np.dtype(dtype).itemsize * columns * self.count
+            array[:self.count] = np.frombuffer(data, dtype=dtype, count=columns * self.count,
+                                               offset=offset).reshape(array[:self.count].shape)
+            offset += size
+
+    def add_car(self, position, radius, drag, angular_drag, angle, car_type, is_ai, ai_type):
+        if self.count == self.capacity:
+            self.grow(self.capacity * 2)
+        index = self.count
+        self.count += 1
+        self.position[index] = position
+        self.velocity[index] = 0
+        self.angle[index] = angle
+        self.angular_velocity[index] = 0
+        self.radius[index] = radius
+        self.drag[index] = drag
+        self.angular_drag[index] = angular_drag
+        self.power_penalty[index] = 1
+        self.teleport_timer[index] = 5
+        self.score[index] = -1
+        self.waypoint_index[index] = 0
+        self.car_type[index] = car_type
+        self.ai_type[index] = ai_type
+        self.is_ai[index] = is_ai
+        self.on_finishline[index] = False
+        return index
+
+    def integrate(self, dt, cars=None):
+        # movement, drag and side grip for all cars (or the given indices)
+        # in one go, same steps as the old per-car update
+        if cars is None:
+            cars = slice(0, self.count)
+        position = self.position[cars]
+        velocity = self.velocity[cars]
+
+        position += velocity * dt
+        velocity *= (1 - dt * self.drag[cars])[:, None]
+
+        angle = np.radians(self.angle[cars])
+        right = np.stack((-np.sin(angle), np.cos(angle)), axis=1)
+        speed = np.sqrt((velocity * velocity).sum(axis=1))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inverse = np.where(speed > 0, 1 / speed, 0)
+        side_velocity = (right * velocity * inverse[:, None]).sum(axis=1)
+
+        self.power_penalty[cars] = np.maximum(self.power_penalty[cars] - dt, 1)
+
+        velocity += right * (-side_velocity * 900 * dt)[:, None]
+        speed = np.sqrt((velocity * velocity).sum(axis=1))
+        strength = np.maximum((1000 - speed) / 1000, 0)
+        velocity += right * (-side_velocity * strength * 600 * dt)[:, None]
+
+        angular_velocity = self.angular_velocity[cars] * \
+            (1 - dt * self.angular_drag[cars])
+        self.angular_velocity[cars] = angular_velocity
+        self.angle[cars] += angular_velocity * dt
+
+        self.position[cars] = position
+        self.velocity[cars] = velocity
+
+
+def world_field(name):
+    def get(self):
+        return getattr(self.world, name)[self.index]
+
+    def set(self, value):
+        getattr(self.world, name)[self.index] = value
+    return property(get, set)
+
+
+class Car():
+    __slots__ = ("world", "index")
+
+    def __init__(self, world, position=None, radius=40.0, drag=0.3, angular_drag=4, angle=0, car_type=0, is_ai=False, ai_type=0) -> None:
+        if position is None:
+            position = [0.0, 0.0]
+        self.world = world
+        self.index = world.add_car(position, radius, drag, angular_drag,
+                                   angle, car_type, is_ai, ai_type)
+
+    position = world_field("position")
+    velocity = world_field("velocity")
+    angle = world_field("angle")
+    angular_velocity = world_field("angular_velocity")
+    radius = world_field("radius")
+    drag = world_field("drag")
+    angular_drag = world_field("angular_drag")
+    power_penalty = world_field("power_penalty")
+    teleport_timer = world_field("teleport_timer")
+    score = world_field("score")
+    waypoint_index = world_field("waypoint_index")
+    car_type = world_field("car_type")
+    ai_type = world_field("ai_type")
+    is_ai = world_field("is_ai")
+    on_finishline = world_field("on_finishline")
+
+    def apply_force(self, x, y, dt):
+        self.velocity[0] += x * dt
+        self.velocity[1] += y * dt
+
+    def handle_user_input(self, input: str, dt):
+        # input: up, down, left, right
+        angle = math.radians(self.angle)
+        acceleration = (self.score * 1 + 15) * 60  # 60 fps
+        acceleration /= self.power_penalty
+        direction = [math.cos(angle), math.sin(angle)]
+        if input == "up":
+            self.apply_force(direction[0] * acceleration,
+                             direction[1] * acceleration, dt)
+        if input == "down":
+            self.apply_force(-direction[0] *
+                             acceleration, -direction[1] * acceleration, dt)
+        if input == "left":
+            self.angular_velocity -= 1200 * dt
+        if input == "right":
+            self.angular_velocity += 1200 * dt
+        if input == "break":
+            break_force = 1000
+            if length(self.velocity) > break_force * dt:
+                direction = normalize(self.velocity)
+                self.velocity[0] -= direction[0] * break_force * dt
+                self.velocity[1] -= direction[1] * break_force * dt
+            else:
+                self.velocity[0] = 0
+                self.velocity[1] = 0
+
+    def update(self, dt, walls, finishline, ai_waypoints, players, sounds):
+        # one car on its own, the Simulation steps all cars together
+        self.update_movement(dt)
+        collided = walls.collide([self])[0]
+        self.update_after_collision(
+            dt, collided, finishline, ai_waypoints, players, sounds)
+        for player in players:
+            if player != self:
+                if self.handle_player_collision(player):
+                    play_collision_sound(
+                        sounds, "collision_car_car", players, self.position)
+
+    def update_movement(self, dt):
+        self.world.integrate(dt, [self.index])
+
+    def update_after_collision(self, dt, collided, finishline, ai_waypoints, players, sounds, drive_ai=True):
+        if collided:
+            play_collision_sound(sounds, "collision", players, self.position)
+
+        if point_aabb(self.position[0], self.position[1], finishline[0], finishline[1], finishline[2], finishline[3]):
+            if not self.on_finishline:
+                self.on_finishline = True
+                self.score += 1
+        else:
+            self.on_finishline = False
+
+        self.angle %= 360
+
+        if self.is_ai and drive_ai:
+            self.update_ai(dt, ai_waypoints)
+
+    def handle_player_collision(self, player):
+        collision = sphere_sphere(
+            self.position[0], self.position[1], self.radius * 1.25, player.position[0], player.position[1], player.radius * 1.25)
+        if collision:
+            self.position[0] += collision[1][0] * collision[2] * 0.5
+            self.position[1] += collision[1][1] * collision[2] * 0.5
+
+            player.position[0] -= collision[1][0] * collision[2] * 0.5
+            player.position[1] -= collision[1][1] * collision[2] * 0.5
+
+            local_velocity = (
+                self.velocity[0] - player.velocity[0], self.velocity[1] - player.velocity[1])
+
+            direction = dot_product(local_velocity, collision[1])
+
+            self.velocity[0] -= direction * collision[1][0] * 0.5
+            self.velocity[1] -= direction * collision[1][1] * 0.5
+
+            player.velocity[0] += direction * collision[1][0] * 0.5
+            player.velocity[1] += direction * collision[1][1] * 0.5
+            return True
+        return False
+
+    def update_ai(self, dt, ai_waypoints):
+        car_angle = math.radians(self.angle)
+        next_waypoint = ai_waypoints[self.ai_type][self.waypoint_index]
+        difference = [next_waypoint[0] - self.position[0],
+                      next_waypoint[1] - self.position[1]]
+        self.teleport_timer -= dt
+        if length(difference) < 400:  # 400: overpowered
+            self.waypoint_index += 1
+            self.waypoint_index %= len(ai_waypoints[self.ai_type])
+            self.teleport_timer = 5
+        if self.teleport_timer <= 0:
+            self.position = [next_waypoint[0], next_waypoint[1]]
+        target_angle = math.atan2(difference[0], difference[1])
+        self.angle = math.degrees(
+            lerp(car_angle, -target_angle + math.pi * 0.5, 0.035))
+        # car_right_vector = [-math.sin(math.radians(self.angle)),
+        #                    math.cos(math.radians(self.angle))]
+        # correction_angle = -dot_product(normalize(self.velocity),
+        # car_right_vector)
+        # self.angle += correction_angle
+        self.handle_user_input("up", dt)
@@ -0,0 +1,279 @@
+import math
+
+
+def dot_product(a1, a2):
+    return a1[0] * a2[0] + a1[1] * a2[1]
+
+
+def length(a1):
+    return math.sqrt(a1[0] * a1[0] + a1[1] * a1[1])
+
+
+def normalize(a1):
+    l = length(a1)
+    if l == 0:
+        return [0, 0]
+    i = 1 / l
+    return [a1[0] * i, a1[1] * i]
+
+
+def point_aabb(px, py, x, y, w, h):
+    return px > x and py and px < x + w and py > y and py < y + h
+
+
+def is_obb_overlap(o1, o2):
+    # axes vector
+    a1 = [math.cos(o1.rotation), math.sin(o1.rotation)]
+    a2 = [-math.sin(o1.rotation), math.cos(o1.rotation)]
+    a3 = [math.cos(o2.rotation), math.sin(o2.rotation)]
+    a4 = [-math.sin(o2.rotation), math.cos(o2.rotation)]
+
+    # edge length
+    l1 = [i * 0.5 for i in o1.size]
+    l2 = [i * 0.5 for i in o2.size]
+
+    # vector between pivots
+    l = [o1_p - o2_p for o1_p, o2_p in zip(o1.pivot, o2.pivot)]
+
+    min_overlap = float('inf')
+    separating_axis = None
+
+    for a in [a1, a2, a3, a4]:
+        r1 = l1[0] * abs(dot_product(a1, a))
+        r2 = l1[1] * abs(dot_product(a2, a))
+        r3 = l2[0] * abs(dot_product(a3, a))
+        r4 = l2[1] * abs(dot_product(a4, a))
+        overlap = r1 + r2 + r3 + r4 - abs(dot_product(l, a))
+        if overlap <= 0:
+            return None, 0
+        elif overlap < min_overlap:
+            min_overlap = overlap
+            separating_axis = a
+
+    return separating_axis, min_overlap
+
+
+def point_abb_distance(x, y, w, h, px, py):
+    d = 0
+    if px < x:
+        d += pow(px - x, 2)
+    elif px > (x + w):
+        d += pow(px - (x + w), 2)
+
+    if py < y:
+        d += pow(py - y, 2)
+    elif py > (y + h):
+        d += pow(py - (y + h), 2)
+
+    return math.sqrt(d)
+
+
+def closest_point_to_aabb(x, y, w, h, cx, cy):
+    hit_x, hit_y = cx, cy
+    if cx < x:
+        hit_x = x
+    elif cx > (x + w):
+        hit_x = x + w
+    if cy < y:
+        hit_y = y
+    elif cy > (y + h):
+        hit_y = y + h
+    return hit_x, hit_y
+
+
+def aabb_circle(x, y, w, h, cx, cy, radius):
+    dist = point_abb_distance(x, y, w, h, cx, cy)
+    hit_pos = closest_point_to_aabb(x, y, w, h, cx, cy)
+    if dist < radius:
+        return hit_pos, normalize((cx - hit_pos[0], cy - hit_pos[1])), radius - dist
+    else:
+        return False
+
+
+def sweep_circle_aabb(px, py, dx, dy, radius, x, y, w, h):
+    # first t in 0..1 where a circle moving from (px, py) by (dx, dy) touches
+    # the rectangle while moving into it, or None. a circle that already
+    # overlaps it is left to aabb_circle, one that only grazes it or moves
+    # away from where it touches is not a hit. the rectangle grown by the
+    # radius is tested first, when that is entered next to a corner the
+    # corner circle is tested instead.
+    if point_abb_distance(x, y, w, h, px, py) < radius:
+        return None
+    t_enter, t_exit = 0.0, 1.0
+    for p, d, low, high in ((px, dx, x - radius, x + w + radius), (py, dy, y - radius, y + h + radius)):
+        if d == 0:
+            if p <= low or p >= high:
+                return None
+            continue
+        t1 = (low - p) / d
+        t2 = (high - p) / d
+        if t1 > t2:
+            t1, t2 = t2, t1
+        t_enter = max(t_enter, t1)
+        t_exit = min(t_exit, t2)
+        if t_enter >= t_exit:
+            return None
+    hit_x = px + dx * t_enter
+    hit_y = py + dy * t_enter
+    if x <= hit_x <= x + w or y <= hit_y <= y + h:
+        return t_enter
+    corner_x = x if hit_x < x else x + w
+    corner_y = y if hit_y < y else y + h
+    ox = px - corner_x
+    oy = py - corner_y
+    a = dx * dx + dy * dy
+    b = 2 * (ox * dx + oy * dy)
+    c = ox * ox + oy * oy - radius * radius
+    discriminant = b * b - 4 * a * c
+    # at 0 the path only grazes the corner
+    if discriminant <= 0:
+        return None
+    t = (-b - math.sqrt(discriminant)) / (2 * a)
+    if 0 <= t <= 1:
+        return t
+    return None
+
+
+def sphere_sphere(x, y, r, x1, y1, r1):
+    dist = length((x - x1, y - y1))
+    if dist < r + r1:
+        return (x + x1, y + y1), normalize((x - x1, y - y1)), (r + r1) - dist
+    else:
+        return False
+
+
+def split_rows(wall, row_spacing):
+    # a merged scanline stack from track_compiler back into its single rows
+    x, y = wall.position
+    count = round(wall.size[1] / row_spacing) + 1
+    return [type(wall)([x, y + i * row_spacing], [wall.size[0], 0], wall.rotation)
+            for i in range(count)]
+
+
+def resolve_wall_collision(player, wall):
+    collision = aabb_circle(wall.position[0], wall.position[1], wall.size[0],
+                            wall.size[1], player.position[0], player.position[1], player.radius)
+    if collision == False:  # position,normal,depth
+        return False
+    player.position[0] += collision[1][0] * collision[2]
+    player.position[1] += collision[1][1] * collision[2]
+    slide_along_wall(player, collision[1])
+    return True
+
+
+def slide_along_wall(player, normal):
+    # lose the speed into the wall and get the power penalty for hitting it
+    direction = dot_product(player.velocity, normal)
+
+    player.velocity[0] -= direction * normal[0]
+    player.velocity[1] -= direction * normal[1]
+
+    player.power_penalty = min(
+        max(length(player.velocity) / 100, 1.5), 2.5)
+
+
+class WallGrid():
+    # uniform grid over the wall rectangles, built once after the walls are
+    # scaled. every cell holds the indices of the walls whose rectangle
+    # touches it, so a car only has to test the walls in the cells its
+    # radius overlaps instead of the whole track.
+    #
+    # with row_spacing set the walls are merged scanline stacks from
+    # track_compiler, and query hands back the single rows near the car
+    # so they are resolved exactly like the original spans.
+    def __init__(self, walls, cell_size=256, row_spacing=None) -> None:
+        self.walls = walls
+        self.cell_size = cell_size
+        self.row_spacing = row_spacing
+        self.cells = {}
+        for index, wall in enumerate(walls):
+            x, y = wall.position
+            w, h = wall.size
+            for cell in self.cells_in_rect(x, y, x + w, y + h):
+                self.cells.setdefault(cell, []).append(index)
+
+        self.rows = None
+        if row_spacing is not None:
+            self.rows = [split_rows(wall, row_spacing) for wall in walls]
+
+    def cells_in_rect(self, x1, y1, x2, y2):
+        inverse = 1 / self.cell_size
+        for cx in range(math.floor(x1 * inverse), math.floor(x2 * inverse) + 1):
+            for cy in range(math.floor(y1 * inverse), math.floor(y2 * inverse) + 1):
+                yield cx, cy
+
+    def query(self, x, y, radius):
+        # walls come back in their original order so resolving them one by
+        # one gives the same result as looping over the full list
+        found = set()
+        for cell in self.cells_in_rect(x - radius, y - radius, x + radius, y + radius):
+            indices = self.cells.get(cell)
+            if indices is not None:
+                found.update(indices)
+        walls = self.walls
+        if self.rows is None:
+            return [walls[i] for i in sorted(found)]
+
+        spacing = self.row_spacing
+        spans = []
+        for i in found:
+            wall = walls[i]
+            wx, wy = wall.position
+            if x + radius < wx or x - radius > wx + wall.size[0]:
+                continue
+            rows = self.rows[i]
+            first = max(math.ceil((y - radius - wy) / spacing), 0)
+            last = min(math.floor((y + radius - wy) / spacing), len(rows) - 1)
+            spans += rows[first:last + 1]
+        spans.sort(key=lambda wall: (wall.position[1], wall.position[0]))
+        return spans
+
+    def collide(self, players):
+        # pure python backend, one car and one wall at a time
+        collided = []
+        for player in players:
+            hit = False
+            # twice the radius: pushing out of one wall can move the car into the next
+            for wall in self.query(player.position[0], player.position[1], player.radius * 2):
+                if resolve_wall_collision(player, wall):
+                    hit = True
+            collided.append(hit)
+        return collided
+
+    def __iter__(self):
+        return iter(self.walls)
+
+    def __len__(self):
+        return len(self.walls)
+
+
+class CarHash():
+    # spatial hash for car against car contacts. cars only meet when they
+    # are closer than 2.5 radius (both use 1.25 radius), so with cells of
+    # that size every contact is in the same or a neighbouring cell.
+    neighbours = [(1, -1), (1, 0), (1, 1), (0, 1)]
+
+    def __init__(self, cell_size) -> None:
+        self.cell_size = cell_size
+
+    def pairs(self, positions):
+        # every pair of cars that could touch, once, as (i, j) with i < j
+        inverse = 1 / self.cell_size
+        cells = {}
+        for i, (x, y) in enumerate(positions):
+            cells.setdefault((math.floor(x * inverse), math.floor(y * inverse)), []).append(i)
+
+        pairs = []
+        for (cx, cy), cars in cells.items():
+            for a in range(len(cars)):
+                for b in range(a + 1, len(cars)):
+                    pairs.append((cars[a], cars[b]))
+            # only half of the neighbours, the other half sees this cell
+            for dx, dy in self.neighbours:
+                others = cells.get((cx + dx, cy + dy))
+                if others is not None:
+                    for a in cars:
+                        for b in others:
+                            pairs.append((a, b) if a < b else (b, a))
+        pairs.sort()
+        return pairs
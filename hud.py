@@ -0,0 +1,61 @@
+from collections import OrderedDict
+import pygame
+
+# the text on top of the race. the font is loaded once and rendered text
+# is kept per (string, colour), so nothing is rendered again while a value
+# stays the same.
+
+
+class TextCache():
+    def __init__(self, font, max_entries=64) -> None:
+        self.font = font
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+
+    def render(self, text, color):
+        key = (text, color)
+        surface = self.cache.get(key)
+        if surface is None:
+            surface = self.font.render(text, True, color)
+            self.cache[key] = surface
+            if len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        return surface
+
+
+class Hud():
+    def __init__(self, font_name='bauhaus93', size=32, bold=True, max_entries=64) -> None:
+        self.font = pygame.font.SysFont(font_name, size, bold=bold)
+        self.text = TextCache(self.font, max_entries)
+        # name: [value, surface, position]
+        self.elements = {}
+        # (name, template, position) per score line, made once
+        self.score_lines = []
+
+    def set(self, name, value, template, color, position):
+        # the text is only formatted and rendered when the value changed
+        element = self.elements.get(name)
+        if element is not None and element[0] == value:
+            element[2] = position
+            return
+        surface = self.text.render(template.format(value), color)
+        self.elements[name] = [value, surface, position]
+
+    def remove(self, name):
+        self.elements.pop(name, None)
+
+    def show_scores(self, players, names, colors, position=(10, 10)):
+        # one line per car under each other
+        if len(self.score_lines) != len(players):
+            line = self.font.get_linesize()
+            self.score_lines = [(("score", i), names[i] + " score: {}", (position[0], position[1] + i * line))
+                                for i in range(len(players))]
+        for i, player in enumerate(players):
+            name, template, line_position = self.score_lines[i]
+            self.set(name, player.score, template, colors[i], line_position)
+
+    def draw(self, screen):
+        for value, surface, position in self.elements.values():
+            screen.blit(surface, position)
@@ -0,0 +1,141 @@
+import math
+from collections import OrderedDict
+
+# which cars a client of server.py gets told about. the cars are put in a
+# grid over the 15360x8640 track, and every client only looks at the cells
+# around its own car: cars in and just around its 1280x720 view are sent in
+# every snapshot, cars further away up to `far_radius` only in every
+# `far_every`th snapshot and everything else not at all.
+
+
+class InterestGrid():
+    def __init__(self, view=(1280, 720), margin=400, far_radius=4000, far_every=4) -> None:
+        self.half_width = view[0] / 2 + margin
+        self.half_height = view[1] / 2 + margin
+        self.far_radius = far_radius
+        self.far_every = far_every
+        # cells about the size of the view, so the view covers a few cells
+        # and the far circle only the cells around them
+        self.cell_size = min(self.half_width, self.half_height) * 2
+        self.columns = {}
+        self.positions = []
+
+    def build(self, positions):
+        # positions of every car, once per snapshot. cells are kept by
+        # column, and the cars of a cell both with their positions and
+        # split by car % far_every, the far cars that take turns together
+        inverse = 1 / self.cell_size
+        far_every = self.far_every
+        self.columns = {}
+        for car, (x, y) in enumerate(positions):
+            column = self.columns.setdefault(math.floor(x * inverse), {})
+            cell = column.get(math.floor(y * inverse))
+            if cell is None:
+                cell = column[math.floor(y * inverse)] = ([], [[] for i in range(far_every)])
+            cell[0].append((car, x, y, car % far_every))
+            cell[1][car % far_every].append(car)
+        self.positions = positions
+
+    def relevant(self, viewer, snapshot):
+        # the cars `viewer` is sent in the `snapshot`th snapshot, and the
+        # far cars it is not sent this time but keeps
+        x, y = self.positions[viewer]
+        size = self.cell_size
+        inverse = 1 / size
+        half_width, half_height = self.half_width, self.half_height
+        far_radius = self.far_radius
+        far_radius_squared = far_radius * far_radius
+        # the far cars sent this time
+        turn = -snapshot % self.far_every
+        # the cells under the view and around the far circle
+        view_x = range(math.floor((x - half_width) * inverse), math.floor((x + half_width) * inverse) + 1)
+        view_y = range(math.floor((y - half_height) * inverse), math.floor((y + half_height) * inverse) + 1)
+        far_y = range(math.floor((y - far_radius) * inverse), math.floor((y + far_radius) * inverse) + 1)
+        cars = []
+        keep = []
+        for cx in range(math.floor((x - far_radius) * inverse), math.floor((x + far_radius) * inverse) + 1):
+            column = self.columns.get(cx)
+            if column is None:
+                continue
+            # distance from the viewer to the closest and furthest point of the cell
+            left, right = cx * size - x, (cx + 1) * size - x
+            near_x = max(left, -right, 0)
+            furthest_x = max(-left, right)
+            column_in_view = cx in view_x
+            for cy, (members, groups) in column.items():
+                if cy not in far_y:
+                    continue
+                top, bottom = cy * size - y, (cy + 1) * size - y
+                near_y = max(top, -bottom, 0)
+                furthest_y = max(-top, bottom)
+                in_view = column_in_view and cy in view_y
+                if in_view and furthest_x <= half_width and furthest_y <= half_height:
+                    # the whole cell is in the view
+                    for group in groups:
+                        cars += group
+                    continue
+                if near_x * near_x + near_y * near_y > far_radius_squared:
+                    continue
+                if not in_view and furthest_x * furthest_x + furthest_y * furthest_y <= far_radius_squared:
+                    # the whole cell is far
+                    for i, group in enumerate(groups):
+                        if i == turn:
+                            cars += group
+                        else:
+                            keep += group
+                    continue
+                for car, other_x, other_y, i in members:
+                    if in_view and abs(other_x - x) <= half_width and abs(other_y - y) <= half_height:
+                        cars.append(car)
+                    elif (other_x - x) ** 2 + (other_y - y) ** 2 <= far_radius_squared:
+                        # spread the far cars over the snapshots
+                        if i == turn:
+                            cars.append(car)
+                        else:
+                            keep.append(car)
+        return cars, keep
+
+
+class ClientView():
+    def __init__(self, max_history=64) -> None:
+        # tick: the cars as the client has them after that snapshot, None
+        # for the cars it does not see
+        self.history = OrderedDict()
+        # tick: the cars that are not None then
+        self.seen = {}
+        self.max_history = max_history
+        self.ack = 0
+
+    def acknowledge(self, tick):
+        if tick in self.history and tick > self.ack:
+            self.ack = tick
+            # older snapshots are never a base again
+            while next(iter(self.history)) < tick:
+                self.seen.pop(self.history.popitem(last=False)[0])
+
+    def next_view(self, tick, cars, relevant, keep):
+        # the cars after this snapshot, the ones it is based on and the cars
+        # that can differ between them. cars in `relevant` get the new
+        # values, cars in `keep` keep what the client has and all other
+        # cars are dropped
+        base = self.history.get(self.ack)
+        base_seen = self.seen.get(self.ack, ())
+        if base is None:
+            self.ack = 0
+            base_seen = ()
+        view = [None] * len(cars)
+        for car in relevant:
+            view[car] = cars[car]
+        seen = set(relevant)
+        if base is not None:
+            for car in keep:
+                if car < len(base) and base[car] is not None:
+                    view[car] = base[car]
+                    seen.add(car)
+        self.history[tick] = view
+        self.seen[tick] = seen
+        if len(self.history) > self.max_history:
+            self.seen.pop(self.history.popitem(last=False)[0])
+        # cars that are new, changed or dropped since the base
+        check = sorted(seen.union(base_seen))
+        return self.ack, base, view, check
@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import random
+import subprocess
+import sys
+import time
+import protocol
+
+# opens a lot of clients against server.py, every client joins a room and
+# changes its keys a few times per second. reports how many snapshots and
+# bytes per second reach the clients.
+#
+# python load_test.py --clients 200 --start-server
+
+key_sets = [["up"], ["up", "left"], ["up", "right"], [], ["down"]]
+
+
+class Stats():
+    def __init__(self) -> None:
+        self.connected = 0
+        self.snapshots = 0
+        self.bytes = 0
+        self.failed = 0
+
+
+async def client(host, port, room, duration, input_rate, stats, rng):
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        stats.failed += 1
+        return
+    server_version, quantizer = protocol.decode(await protocol.read_frame(reader))[1]
+    if server_version != protocol.version:
+        stats.failed += 1
+        writer.close()
+        return
+    snapshots = protocol.Snapshots(quantizer)
+    writer.write(protocol.encode_join(room))
+    stats.connected += 1
+
+    async def send_inputs():
+        sequence = 0
+        while True:
+            sequence += 1
+            keys = rng.choice(key_sets)
+            writer.write(protocol.encode_input(sequence, protocol.input_bits(keys)))
+            await asyncio.sleep(1 / input_rate)
+
+    sender = asyncio.create_task(send_inputs())
+    end = time.perf_counter() + duration
+    try:
+        while time.perf_counter() < end:
+            try:
+                payload = await asyncio.wait_for(protocol.read_frame(reader), end - time.perf_counter())
+            except asyncio.TimeoutError:
+                break
+            if payload is None:
+                break
+            stats.bytes += protocol.frame_header.size + len(payload)
+            kind, value = protocol.decode(payload)
+            if kind == protocol.DELTA and snapshots.apply(*value) is not None:
+                writer.write(protocol.encode_ack(value[0]))
+                stats.snapshots += 1
+    finally:
+        sender.cancel()
+        writer.close()
+
+
+async def wait_for_server(host, port, timeout=10):
+    # the protocol version of the server, None when there is none
+    end = time.perf_counter() + timeout
+    while time.perf_counter() < end:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            await asyncio.sleep(0.1)
+            continue
+        try:
+            return protocol.decode(await protocol.read_frame(reader))[1][0]
+        finally:
+            writer.close()
+    return None
+
+
+async def run(args):
+    server_version = await wait_for_server(args.host, args.port)
+    if server_version is None:
+        print(f"no server on {args.host}:{args.port}")
+        return
+    if server_version != protocol.version:
+        print(f"the server speaks protocol version {server_version}, this client {protocol.version}")
+        return
+    stats = Stats()
+    rng = random.Random(args.seed)
+    tasks = []
+    for i in range(args.clients):
+        room = f"room{i // args.clients_per_room}"
+        tasks.append(asyncio.create_task(
+            client(args.host, args.port, room, args.duration, args.input_rate, stats, rng)))
+        # do not open every connection in the same instant
+        if i % 50 == 49:
+            await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    print(f"{stats.connected} clients connected, {stats.failed} failed")
+    print(f"{stats.snapshots / elapsed:.0f} snapshots/s in total, "
+          f"{stats.snapshots / elapsed / max(stats.connected, 1):.1f} per client")
+    print(f"{stats.bytes / elapsed / 1024:.1f} KiB/s in total, "
+          f"{stats.bytes / elapsed / max(stats.connected, 1):.0f} bytes/s per client")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load test for server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--clients-per-room", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds every client stays connected")
+    parser.add_argument("--input-rate", type=float, default=5,
+                        help="input messages per second per client")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start-server", action="store_true",
+                        help="start server.py on --port for the test")
+    parser.add_argument("--server-args", default="",
+                        help="more arguments for the started server, like \"--no-delta\"")
+    args = parser.parse_args()
+
+    server = None
+    if args.start_server:
+        server = subprocess.Popen([sys.executable, "server.py", "--host", args.host,
+                                   "--port", str(args.port), "--max-cars", str(args.clients_per_room)]
+                                  + args.server_args.split())
+    try:
+        asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,120 @@
+import queue
 import socket
+import threading
+import time
+import protocol
+
+# client side of server.py. join() and send() wait for the server, for the
+# game loop start() runs the receiving on a thread instead: snapshots are
+# put in `inbox` as (arrival time, tick, cars) and send_input() only
+# writes, so a frame never waits for the network. score changes go to
+# `scores` as lists of (car, score).
 
 
 class Network:
-    def __init__(self):
+    def __init__(self, server="SERVER_IP", port=5555):
         self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server = "SERVER_IP"
-        self.port = 5555
+        self.server = server
+        self.port = port
         self.addr = (self.server, self.port)
+        self.buffer = bytearray()
+        self.payloads = []
+        self.sequence = 0
+        self.snapshots = None
+        self.inbox = queue.Queue()
+        self.scores = queue.Queue()
+        self.send_lock = threading.Lock()
+        self.thread = None
+        self.closed = False
+        self.track = None
         self.id = self.connect()
         print(self.id)
 
     def connect(self):
         try:
             self.client.connect(self.addr)
-            return self.client.recv(2048).decode()
+            self.client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # protocol version of the server
+            server_version, quantizer = self.receive()[1]
         except:
-            pass
+            return None
+        # the other messages of another version would be misread
+        if server_version != protocol.version:
+            self.close()
+            raise ConnectionError(f"the server speaks protocol version {server_version}, "
+                                  f"this client {protocol.version}")
+        self.snapshots = protocol.Snapshots(quantizer)
+        return server_version
+
+    def receive(self):
+        # the next whole message from the server as (type, values)
+        while not self.payloads:
+            data = self.client.recv(4096)
+            if not data:
+                raise ConnectionError("server closed the connection")
+            self.buffer += data
+            self.payloads = protocol.split_frames(self.buffer)
+        return protocol.decode(self.payloads.pop(0))
+
+    def write(self, data):
+        with self.send_lock:
+            self.client.sendall(data)
+
+    def join(self, room="lobby", track=None):
+        # returns the index of our car in the snapshots, the track file of
+        # the room is in self.track afterwards
+        self.write(protocol.encode_join(room, track))
+        while True:
+            kind, value = self.receive()
+            if kind == protocol.ID:
+                car, self.track = value
+                return car
+
+    def apply_snapshot(self, kind, value):
+        # (tick, cars) for a state or a usable delta, otherwise None
+        if kind == protocol.STATE:
+            return value
+        if kind == protocol.DELTA:
+            cars = self.snapshots.apply(*value)
+            if cars is not None:
+                self.write(protocol.encode_ack(value[0]))
+                return value[0], self.snapshots.state(cars)
+        if kind == protocol.SCORES:
+            self.scores.put(value)
+        return None
 
-    def send(self, data):
+    def send(self, inputs):
+        # the keys held down, returns the next snapshot (tick, cars)
         try:
-            self.client.send(str.encode(data))
-            return self.client.recv(2048).decode()
+            self.send_input(inputs)
+            while True:
+                snapshot = self.apply_snapshot(*self.receive())
+                if snapshot is not None:
+                    return snapshot
         except socket.error as e:
             print(e)
+
+    def send_input(self, inputs):
+        # returns the sequence number the server will report back
+        self.sequence += 1
+        self.write(protocol.encode_input(self.sequence, protocol.input_bits(inputs)))
+        return self.sequence
+
+    def start(self):
+        self.thread = threading.Thread(target=self.receive_loop, daemon=True)
+        self.thread.start()
+
+    def receive_loop(self):
+        try:
+            while not self.closed:
+                snapshot = self.apply_snapshot(*self.receive())
+                if snapshot is not None:
+                    self.inbox.put((time.perf_counter(),) + snapshot)
+        except (OSError, ValueError) as e:
+            if not self.closed:
+                print(e)
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+        self.client.close()
@@ -0,0 +1,95 @@
+import numpy as np
+from collision import split_rows
+
+# numpy wall collision backend: the walls are kept as contiguous x, y, w, h
+# arrays and every car is tested against every wall in one pass. same
+# interface as WallGrid.collide so main() can pick either one at startup.
+
+
+class NumpyWalls():
+    def __init__(self, walls, row_spacing=None) -> None:
+        if row_spacing is not None:
+            walls = [row for wall in walls for row in split_rows(wall, row_spacing)]
+        # the python backend resolves the walls top to bottom, left to right
+        walls = sorted(walls, key=lambda wall: (wall.position[1], wall.position[0]))
+        self.walls = walls
+        self.x = np.array([wall.position[0] for wall in walls], dtype=np.float64)
+        self.y = np.array([wall.position[1] for wall in walls], dtype=np.float64)
+        self.w = np.array([wall.size[0] for wall in walls], dtype=np.float64)
+        self.h = np.array([wall.size[1] for wall in walls], dtype=np.float64)
+
+    def query(self, x, y, radius):
+        # the walls touching the square around (x, y), in resolve order
+        near = ((self.x <= x + radius) & (self.x + self.w >= x - radius) &
+                (self.y <= y + radius) & (self.y + self.h >= y - radius))
+        return [self.walls[i] for i in np.flatnonzero(near)]
+
+    def penetration(self, px, py, radius):
+        # depth and normal of every car (rows) against every wall (columns),
+        # same math as aabb_circle. depth <= 0 means no contact.
+        px = px[:, None]
+        py = py[:, None]
+        dx = px - np.clip(px, self.x, self.x + self.w)
+        dy = py - np.clip(py, self.y, self.y + self.h)
+        dist = np.sqrt(dx * dx + dy * dy)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inverse = np.where(dist > 0, 1 / dist, 0)
+        return radius[:, None] - dist, dx * inverse, dy * inverse
+
+    def collide(self, players):
+        count = len(players)
+        if count == 0:
+            return []
+        # the cars are views onto one CarWorld, read their rows straight
+        # from its arrays
+        world = players[0].world
+        rows = np.array([player.index for player in players])
+        px = world.position[rows, 0]
+        py = world.position[rows, 1]
+        vx = world.velocity[rows, 0]
+        vy = world.velocity[rows, 1]
+        radius = world.radius[rows]
+        power_penalty = world.power_penalty[rows]
+
+        # broad pass over everything. twice the radius, pushing out of one
+        # wall can move the car into the next.
+        depth, nx, ny = self.penetration(px, py, radius * 2)
+        near = depth > 0
+        collided = np.zeros(count, dtype=bool)
+
+        # the walls that are close to any car are then resolved in order,
+        # all cars touching that wall at once, so every car sees the same
+        # sequence of pushes as in the per-wall loop
+        for wall in np.flatnonzero(near.any(axis=0)):
+            cars = np.flatnonzero(near[:, wall])
+            x, y, w, h = self.x[wall], self.y[wall], self.w[wall], self.h[wall]
+            dx = px[cars] - np.clip(px[cars], x, x + w)
+            dy = py[cars] - np.clip(py[cars], y, y + h)
+            dist = np.sqrt(dx * dx + dy * dy)
+            hit = dist < radius[cars]
+            if not hit.any():
+                continue
+            cars, dx, dy, dist = cars[hit], dx[hit], dy[hit], dist[hit]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                inverse = np.where(dist > 0, 1 / dist, 0)
+            nx = dx * inverse
+            ny = dy * inverse
+            push = radius[cars] - dist
+            px[cars] += nx * push
+            py[cars] += ny * push
+
+            direction = vx[cars] * nx + vy[cars] * ny
+            vx[cars] -= direction * nx
+            vy[cars] -= direction * ny
+
+            speed = np.sqrt(vx[cars] * vx[cars] + vy[cars] * vy[cars])
+            power_penalty[cars] = np.minimum(np.maximum(speed / 100, 1.5), 2.5)
+            collided[cars] = True
+
+        rows = rows[collided]
+        world.position[rows, 0] = px[collided]
+        world.position[rows, 1] = py[collided]
+        world.velocity[rows, 0] = vx[collided]
+        world.velocity[rows, 1] = vy[collided]
+        world.power_penalty[rows] = power_penalty[collided]
+        return collided.tolist()
@@ -0,0 +1,215 @@
+import time
+from collections import deque
+import numpy as np
+from car import Car, CarWorld
+from simulation import Simulation
+
+# a race on server.py as seen by one client. our own car is predicted with
+# the same fixed step Simulation the server runs, and when a snapshot of
+# the server arrives the car is put back where the server had it and the
+# inputs the server has not used yet are played again. the jump that
+# leaves on screen fades out. the other cars are drawn
+# `interpolation_delay` seconds in the past, in between the two snapshots
+# around that time, so they move smoothly whatever the network does.
+# nothing in here waits for the network, Network.start() has to be called.
+# cars the server does not tell us about are moved to `hidden_position`,
+# outside of every camera.
+
+hidden_position = [-1e6, -1e6]
+
+
+class OnlineRace():
+    def __init__(self, network, car, walls, finishline, ai_waypoints, timestep=1 / 60, max_steps=8,
+                 interpolation_delay=0.1, correction_time=0.1, sounds=None, car_class=Car) -> None:
+        self.network = network
+        # our index in the snapshots
+        self.car = car
+        self.car_class = car_class
+        # every car as it is drawn, in snapshot order
+        self.world = CarWorld()
+        self.players = []
+        # our car alone, for the prediction
+        self.prediction_world = CarWorld(capacity=1)
+        self.local = Car(self.prediction_world)
+        self.simulation = Simulation(self.prediction_world, [self.local], walls, finishline,
+                                     ai_waypoints, timestep=timestep, max_steps=max_steps, sounds=sounds)
+        self.timestep = timestep
+        self.inputs = []
+        # (sequence, inputs) sent and not yet used by the server
+        self.history = deque()
+        # (tick, cars) for the interpolation, oldest first
+        self.snapshots = deque()
+        self.interpolation_delay = interpolation_delay
+        # server tick * timestep - local time, tracks the fastest arrivals
+        self.clock_offset = None
+        # where our car is drawn minus where it is predicted
+        self.correction = np.zeros(2)
+        self.correction_time = correction_time
+        self.corrections = 0
+        # score of every car from the server, ours is predicted
+        self.scores = {}
+
+    def wait_for_start(self, timeout=5):
+        # the first snapshot places our car
+        try:
+            arrival, tick, cars = self.network.inbox.get(timeout=timeout)
+        except Exception:
+            return False
+        self.add_snapshot(arrival, tick, cars)
+        state = cars[self.car]
+        self.local.position = [state[1], state[2]]
+        self.local.velocity = [state[3], state[4]]
+        self.local.angle = state[5]
+        self.simulation.previous_position = self.prediction_world.position[:1].copy()
+        self.simulation.previous_angle = self.prediction_world.angle[:1].copy()
+        return True
+
+    def set_inputs(self, car, inputs):
+        # same as Simulation.set_inputs, car 0 is our own car there too
+        self.inputs = list(inputs)
+
+    def add_snapshot(self, arrival, tick, cars):
+        offset = tick * self.timestep - arrival
+        if self.clock_offset is None or offset > self.clock_offset:
+            self.clock_offset = offset
+        else:
+            # slowly follow a server that drifts behind
+            self.clock_offset += (offset - self.clock_offset) * 0.05
+        if not self.snapshots or tick > self.snapshots[-1][0]:
+            self.snapshots.append((tick, cars))
+        while len(self.snapshots) > 64:
+            self.snapshots.popleft()
+        while len(self.players) < len(cars):
+            state = cars[len(self.players)]
+            position = hidden_position if state is None else [state[1], state[2]]
+            self.players.append(self.car_class(self.world, position=list(position),
+                                               car_type=len(self.players) % 4))
+            self.set_score(len(self.players) - 1)
+
+    def set_score(self, car):
+        if car != self.car and car in self.scores:
+            self.world.score[car] = self.scores[car]
+
+    def receive(self):
+        while True:
+            try:
+                scores = self.network.scores.get_nowait()
+            except Exception:
+                break
+            for car, score in scores:
+                self.scores[car] = score
+                if car < len(self.players):
+                    self.set_score(car)
+        latest = None
+        while True:
+            try:
+                arrival, tick, cars = self.network.inbox.get_nowait()
+            except Exception:
+                break
+            self.add_snapshot(arrival, tick, cars)
+            if latest is None or tick > latest[0]:
+                latest = (tick, cars)
+        if latest is not None and self.car < len(latest[1]) and latest[1][self.car] is not None:
+            self.reconcile(latest[1][self.car])
+
+    def reconcile(self, state):
+        x, y, velocity_x, velocity_y, angle, bits, sequence = state[1:]
+        while self.history and self.history[0][0] <= sequence:
+            self.history.popleft()
+        simulation = self.simulation
+        local = self.local
+        before = self.prediction_world.position[0].copy()
+        before_angle = local.angle
+        # the score and the finish line state already went through these
+        # steps once, playing them again must not count a lap twice
+        score, on_finishline, tick = local.score, local.on_finishline, simulation.tick
+        previous_position = simulation.previous_position.copy()
+        previous_angle = simulation.previous_angle.copy()
+        sounds = simulation.sounds
+        simulation.sounds = None
+
+        local.position = [x, y]
+        local.velocity = [velocity_x, velocity_y]
+        local.angle = angle
+        for used, inputs in self.history:
+            simulation.set_inputs(0, inputs)
+            simulation.step()
+
+        simulation.sounds = sounds
+        local.score, local.on_finishline, simulation.tick = score, on_finishline, tick
+        after = self.prediction_world.position[0]
+        shift = after - before
+        turn = (local.angle - before_angle + 180) % 360 - 180
+        simulation.previous_position = previous_position + shift
+        simulation.previous_angle = previous_angle + turn
+        if np.abs(shift).max() > 0.5:
+            self.corrections += 1
+        self.correction -= shift
+
+    def advance(self, frame_time):
+        # like Simulation.advance, every step also sends its input
+        self.receive()
+        simulation = self.simulation
+        simulation.accumulator += frame_time
+        steps = 0
+        while simulation.accumulator >= self.timestep:
+            if steps == simulation.max_steps:
+                simulation.accumulator = 0.0
+                break
+            if not self.network.closed:
+                try:
+                    sequence = self.network.send_input(self.inputs)
+                    self.history.append((sequence, self.inputs))
+                except OSError:
+                    self.network.closed = True
+            simulation.set_inputs(0, self.inputs)
+            simulation.step()
+            simulation.accumulator -= self.timestep
+            steps += 1
+        self.correction *= 0.5 ** (frame_time / self.correction_time)
+        return simulation.accumulator / self.timestep
+
+    def server_time(self, now):
+        return now + self.clock_offset
+
+    def interpolate(self, alpha, now=None):
+        # positions and angles of every car for drawing, `now` is
+        # time.perf_counter()
+        if now is None:
+            now = time.perf_counter()
+        world = self.world
+        count = world.count
+        if self.snapshots:
+            render_tick = self.server_time(now) / self.timestep - self.interpolation_delay / self.timestep
+            older, newer = self.snapshots[0], self.snapshots[-1]
+            for snapshot in self.snapshots:
+                if snapshot[0] <= render_tick:
+                    older = snapshot
+                else:
+                    newer = snapshot
+                    break
+            if newer[0] > older[0]:
+                t = min(max((render_tick - older[0]) / (newer[0] - older[0]), 0), 1)
+            else:
+                t = 1
+            for car, state in enumerate(newer[1]):
+                if car >= count or car == self.car:
+                    continue
+                if state is None:
+                    world.position[car] = hidden_position
+                    continue
+                start = older[1][car] if car < len(older[1]) else None
+                if start is None:
+                    start = state
+                world.position[car] = [start[1] + (state[1] - start[1]) * t,
+                                       start[2] + (state[2] - start[2]) * t]
+                world.velocity[car] = [state[3], state[4]]
+                world.angle[car] = start[5] + ((state[5] - start[5] + 180) % 360 - 180) * t
+
+        if self.car < count:
+            position, angle = self.simulation.interpolate(alpha)
+            world.position[self.car] = position[0] + self.correction
+            world.velocity[self.car] = self.local.velocity
+            world.angle[self.car] = angle[0]
+            world.score[self.car] = self.local.score
+        return world.position[:count], world.angle[:count]
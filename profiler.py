@@ -0,0 +1,98 @@
+import csv
+import json
+import time
+import numpy as np
+
+# where the frame time goes. the main loop and Simulation.step call lap()
+# at the end of every stage, which adds the time since the previous lap
+# to that stage of the current frame, and end_frame() puts the frame into
+# a ring buffer of the last `frames` frames. percentiles are taken over
+# that buffer, for the overlay and for the dump when the game quits.
+#
+# everything that can be profiled keeps its profiler in an attribute that
+# is None by default and only calls it behind an `is not None` check, so
+# without --profile nothing here runs.
+
+# stages of the main loop, in the order they happen in a frame
+frame_stages = ["events", "tire marks", "input", "step", "walls", "cars", "ai", "car-car",
+                "draw", "shader", "flip", "wait"]
+
+
+class FrameProfiler():
+    def __init__(self, stages=frame_stages, frames=600, refresh=30) -> None:
+        self.stages = list(stages)
+        self.slots = {name: i for i, name in enumerate(self.stages)}
+        # seconds per stage of every frame, the last column is the whole frame
+        self.times = np.zeros((frames, len(self.stages) + 1))
+        self.frames = frames
+        self.count = 0
+        self.current = [0.0] * len(self.stages)
+        self.frame_start = time.perf_counter()
+        self.last = self.frame_start
+        # overlay lines, made again every `refresh` frames
+        self.refresh = refresh
+        self.lines = []
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.current[self.slots[stage]] += now - self.last
+        self.last = now
+
+    def end_frame(self, stage="wait"):
+        # the time since the last lap goes to `stage`
+        self.lap(stage)
+        row = self.times[self.count % self.frames]
+        row[:-1] = self.current
+        row[-1] = self.last - self.frame_start
+        self.count += 1
+        self.current = [0.0] * len(self.stages)
+        self.frame_start = self.last
+        if self.count % self.refresh == 0:
+            self.lines = []
+
+    def recorded(self):
+        # the frames in the ring buffer, oldest first
+        if self.count <= self.frames:
+            return self.times[:self.count]
+        return np.roll(self.times, -(self.count % self.frames), axis=0)
+
+    def percentiles(self, percentiles=(50, 95, 99)):
+        # {stage: [ms per percentile]}, with "frame" for the whole frame
+        times = self.recorded()
+        if len(times) == 0:
+            return {}
+        values = np.percentile(times, percentiles, axis=0).T * 1000
+        return dict(zip(self.stages + ["frame"], values.tolist()))
+
+    def summary(self, percentiles=(50, 95, 99)):
+        heads = "".join(f"{'p' + str(p):>8}" for p in percentiles)
+        lines = [f"{'stage':<11}{heads}   ms over {min(self.count, self.frames)} frames"]
+        for stage, values in self.percentiles(percentiles).items():
+            lines.append(f"{stage:<11}" + "".join(f"{value:8.2f}" for value in values))
+        return lines
+
+    def draw(self, screen, text, position=(10, 60), color=(255, 255, 255)):
+        # the summary on top of the race, `text` is a hud.TextCache. the
+        # numbers change every `refresh` frames so the text is not
+        # rendered again every frame
+        if not self.lines:
+            self.lines = self.summary()
+        x, y = position
+        for line in self.lines:
+            surface = text.render(line, color)
+            screen.blit(surface, (x, y))
+            y += surface.get_height()
+
+    def dump(self, path):
+        # .json has the percentiles, anything else is a csv with every
+        # recorded frame in ms
+        if path.endswith(".json"):
+            with open(path, "w") as file:
+                json.dump({"frames": self.count, "percentiles": [50, 95, 99],
+                           "ms": self.percentiles()}, file, indent=2)
+            return
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(self.stages + ["frame"])
+            for row in (self.recorded() * 1000).round(4).tolist():
+                writer.writerow(row)
@@ -0,0 +1,325 @@
+import struct
+
+# binary messages between server.py and network.py. every message is a
+# 4 byte little endian length followed by that many bytes, the first of
+# which is the message type. one state message carries every car in the
+# room, each car as position, velocity, angle, held keys and the sequence
+# number of the last input of that car the server has used. car indices
+# and counts are 16 bit, a room can hold up to max_cars cars.
+#
+# the server normally sends delta messages instead: the cars quantized to
+# whole steps of a configurable precision, and only the cars and fields
+# that changed since the snapshot the client acknowledged last. small
+# changes are sent as 16 bit differences. a client does not have to know
+# every car, a car it stops seeing is sent with an empty mask and is None
+# in the client's list from then on.
+#
+# scores are not in the snapshots, they change a few times a race. a
+# scores message with the cars whose score changed goes to every client
+# of the room when it happens, and one with all cars on joining.
+
+frame_header = struct.Struct("<I")
+message_type = struct.Struct("<B")
+
+HELLO = 0
+JOIN = 1
+ID = 2
+INPUT = 3
+STATE = 4
+DELTA = 5
+ACK = 6
+SCORES = 7
+
+version = 4
+# version, position step, velocity step, angle steps
+hello_message = struct.Struct("<BBffI")
+# room name length, then the room name and the track file
+join_message = struct.Struct("<BH")
+# car, then the track file of the room
+id_message = struct.Struct("<BH")
+# sequence, input bits
+input_message = struct.Struct("<BIB")
+# tick, car count
+state_header = struct.Struct("<BIH")
+# car, x, y, velocity x, velocity y, angle, input bits, input sequence
+car_state = struct.Struct("<H5fBI")
+# tick, tick of the snapshot it is based on (0 for none), car count
+delta_header = struct.Struct("<BIIH")
+# car, mask of the fields that follow
+car_delta = struct.Struct("<HB")
+ack_message = struct.Struct("<BI")
+# car count, then car and score per car
+scores_header = struct.Struct("<BH")
+car_score = struct.Struct("<Hh")
+
+# quantized fields of a car: x, y, velocity x, velocity y, angle, input
+# bits, input sequence. the first five can be sent as differences, that is
+# bit 7 of the mask.
+full_formats = "iiiiHBI"
+short_formats = "hhhhh"
+short_bit = 1 << 7
+mask_structs = {}
+
+# one bit per key, in this order
+input_names = ("up", "down", "left", "right", "break")
+max_frame = 1 << 16
+max_cars = (1 << 16) - 1
+
+
+def input_bits(inputs):
+    bits = 0
+    for i, name in enumerate(input_names):
+        if name in inputs:
+            bits |= 1 << i
+    return bits
+
+
+def input_list(bits):
+    return [name for i, name in enumerate(input_names) if bits & (1 << i)]
+
+
+def frame(payload):
+    return frame_header.pack(len(payload)) + payload
+
+
+def encode_hello(quantizer):
+    return frame(hello_message.pack(HELLO, version, quantizer.position_step,
+                                    quantizer.velocity_step, quantizer.angle_steps))
+
+
+def encode_join(room, track=None):
+    # no track is the server's default track
+    name = room.encode()
+    return frame(join_message.pack(JOIN, len(name)) + name + (track or "").encode())
+
+
+def encode_id(car, track):
+    return frame(id_message.pack(ID, car) + track.encode())
+
+
+def encode_input(sequence, bits):
+    return frame(input_message.pack(INPUT, sequence, bits))
+
+
+def encode_state(tick, world, count, bits, sequences):
+    # all cars in one buffer, packed in place instead of joined together
+    size = state_header.size + car_state.size * count
+    buffer = bytearray(frame_header.size + size)
+    frame_header.pack_into(buffer, 0, size)
+    state_header.pack_into(buffer, frame_header.size, STATE, tick, count)
+    offset = frame_header.size + state_header.size
+    position = world.position[:count].tolist()
+    velocity = world.velocity[:count].tolist()
+    angle = world.angle[:count].tolist()
+    for car in range(count):
+        car_state.pack_into(buffer, offset, car, position[car][0], position[car][1],
+                            velocity[car][0], velocity[car][1], angle[car],
+                            bits[car], sequences[car])
+        offset += car_state.size
+    return buffer
+
+
+def encode_ack(tick):
+    return frame(ack_message.pack(ACK, tick))
+
+
+def encode_scores(scores):
+    # (car, score) pairs
+    return frame(scores_header.pack(SCORES, len(scores)) +
+                 b"".join(car_score.pack(car, score) for car, score in scores))
+
+
+def mask_struct(mask):
+    values = mask_structs.get(mask)
+    if values is None:
+        formats = short_formats + full_formats[5:] if mask & short_bit else full_formats
+        values = struct.Struct("<" + "".join(formats[i] for i in range(7) if mask & (1 << i)))
+        mask_structs[mask] = values
+    return values
+
+
+class Quantizer():
+    def __init__(self, position_step=0.125, velocity_step=0.5, angle_steps=4096) -> None:
+        # world pixels per step, and steps in a full turn
+        self.position_step = position_step
+        self.velocity_step = velocity_step
+        self.angle_steps = angle_steps
+
+    def quantize(self, world, count, bits, sequences):
+        position = (world.position[:count] / self.position_step).round().astype(int).tolist()
+        velocity = (world.velocity[:count] / self.velocity_step).round().astype(int).tolist()
+        angle = ((world.angle[:count] % 360) * (self.angle_steps / 360)).round().astype(int) % self.angle_steps
+        return [(position[i][0], position[i][1], velocity[i][0], velocity[i][1], turn, bits[i], sequences[i])
+                for i, turn in enumerate(angle.tolist())]
+
+    def dequantize(self, car):
+        x, y, velocity_x, velocity_y, angle, bits, sequence = car
+        return (x * self.position_step, y * self.position_step,
+                velocity_x * self.velocity_step, velocity_y * self.velocity_step,
+                angle * 360 / self.angle_steps, bits, sequence)
+
+
+def wrap_angle(difference, angle_steps):
+    half = angle_steps // 2
+    return (difference + half) % angle_steps - half
+
+
+def encode_delta(tick, cars, base_tick=0, base=None, angle_steps=4096, check=None):
+    # cars are Quantizer.quantize() tuples, base the ones the client has.
+    # None is a car the client does not see. `check` can list the only
+    # cars that can differ from base, sorted.
+    parts = [delta_header.pack(DELTA, tick, base_tick, len(cars))]
+    for car in range(len(cars)) if check is None else check:
+        values = cars[car]
+        old = base[car] if base is not None and car < len(base) else None
+        if values is None:
+            if old is not None:
+                parts.append(car_delta.pack(car, 0))
+            continue
+        if old is not None:
+            if values == old:
+                continue
+            mask = 0
+            for i in range(7):
+                if values[i] != old[i]:
+                    mask |= 1 << i
+            differences = [values[i] - old[i] for i in range(4)]
+            differences.append(wrap_angle(values[4] - old[4], angle_steps))
+            if all(-32768 <= difference <= 32767 for difference in differences):
+                mask |= short_bit
+                fields = [differences[i] for i in range(5) if mask & (1 << i)]
+            else:
+                fields = [values[i] for i in range(5) if mask & (1 << i)]
+            fields += [values[i] for i in range(5, 7) if mask & (1 << i)]
+        else:
+            mask = 0x7f
+            fields = list(values)
+        parts.append(car_delta.pack(car, mask) + mask_struct(mask).pack(*fields))
+    return frame(b"".join(parts))
+
+
+def apply_delta(base, count, changes, angle_steps=4096):
+    # the full list of cars from the acknowledged cars and a decoded delta
+    cars = list(base[:count]) if base is not None else []
+    while len(cars) < count:
+        cars.append(None)
+    for car, mask, fields in changes:
+        if mask == 0:
+            cars[car] = None
+            continue
+        values = list(cars[car] or (0, 0, 0, 0, 0, 0, 0))
+        fields = iter(fields)
+        for i in range(7):
+            if mask & (1 << i):
+                if mask & short_bit and i < 5:
+                    values[i] += next(fields)
+                else:
+                    values[i] = next(fields)
+        values[4] %= angle_steps
+        cars[car] = tuple(values)
+    return cars
+
+
+class Snapshots():
+    def __init__(self, quantizer, max_history=64) -> None:
+        # the client side of the deltas: every snapshot it applied, by tick
+        self.quantizer = quantizer
+        self.max_history = max_history
+        self.history = {}
+        self.latest = 0
+
+    def apply(self, tick, base_tick, count, changes):
+        # returns the quantized cars, or None when the base is not known
+        # or the delta is older than what we have
+        if tick <= self.latest:
+            return None
+        base = None
+        if base_tick:
+            base = self.history.get(base_tick)
+            if base is None:
+                return None
+        cars = apply_delta(base, count, changes, self.quantizer.angle_steps)
+        self.history[tick] = cars
+        self.latest = tick
+        if len(self.history) > self.max_history:
+            del self.history[min(self.history)]
+        return cars
+
+    def state(self, cars):
+        # like a state message: (car, x, y, velocity x, velocity y, angle,
+        # bits, sequence), None for the cars we do not see
+        return [None if values is None else (car,) + self.quantizer.dequantize(values)
+                for car, values in enumerate(cars)]
+
+
+def decode(payload):
+    # payload without the length, returns (type, values)
+    payload = memoryview(payload)
+    kind = payload[0]
+    if kind == STATE:
+        _, tick, count = state_header.unpack_from(payload)
+        end = state_header.size + car_state.size * count
+        cars = list(car_state.iter_unpack(payload[state_header.size:end]))
+        return kind, (tick, cars)
+    if kind == DELTA:
+        _, tick, base_tick, count = delta_header.unpack_from(payload)
+        offset = delta_header.size
+        changes = []
+        while offset < len(payload):
+            car, mask = car_delta.unpack_from(payload, offset)
+            offset += car_delta.size
+            fields = mask_struct(mask)
+            changes.append((car, mask, fields.unpack_from(payload, offset)))
+            offset += fields.size
+        return kind, (tick, base_tick, count, changes)
+    if kind == ACK:
+        return kind, ack_message.unpack(payload)[1]
+    if kind == SCORES:
+        count = scores_header.unpack_from(payload)[1]
+        end = scores_header.size + car_score.size * count
+        return kind, list(car_score.iter_unpack(payload[scores_header.size:end]))
+    if kind == INPUT:
+        _, sequence, bits = input_message.unpack(payload)
+        return kind, (sequence, bits)
+    if kind == JOIN:
+        length = join_message.unpack_from(payload)[1]
+        start = join_message.size
+        room = bytes(payload[start:start + length]).decode()
+        track = bytes(payload[start + length:]).decode()
+        return kind, (room, track or None)
+    if kind == ID:
+        car = id_message.unpack_from(payload)[1]
+        return kind, (car, bytes(payload[id_message.size:]).decode())
+    if kind == HELLO:
+        _, server_version, position_step, velocity_step, angle_steps = hello_message.unpack(payload)
+        return kind, (server_version, Quantizer(position_step, velocity_step, angle_steps))
+    raise ValueError(f"unknown message type {kind}")
+
+
+def split_frames(buffer):
+    # complete frames at the start of a bytearray, removes them from it
+    payloads = []
+    offset = 0
+    while len(buffer) - offset >= frame_header.size:
+        size = frame_header.unpack_from(buffer, offset)[0]
+        if size > max_frame:
+            raise ValueError(f"frame of {size} bytes")
+        if len(buffer) - offset - frame_header.size < size:
+            break
+        start = offset + frame_header.size
+        payloads.append(bytes(buffer[start:start + size]))
+        offset = start + size
+    del buffer[:offset]
+    return payloads
+
+
+async def read_frame(reader):
+    # asyncio.StreamReader, None when the connection is closed
+    try:
+        header = await reader.readexactly(frame_header.size)
+        size = frame_header.unpack(header)[0]
+        if size > max_frame:
+            raise ValueError(f"frame of {size} bytes")
+        return await reader.readexactly(size)
+    except EOFError:
+        return None
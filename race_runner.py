@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from multiprocessing import Pool
+from car import Car, CarWorld
+from simulation import Simulation
+from ccd import SweptCollision
+from track import track_path, get_track
+
+# runs lots of AI-only races without a window, spread over all cores, and
+# reports lap times, collisions and wins per waypoint set.
+#
+# python race_runner.py --races 1000 --cars-per-set 2
+
+track = None
+collision_backend = "python"
+ai_driver = "waypoints"
+continuous = False
+
+
+def init_worker(backend, ai="waypoints", ccd=False, path=track_path):
+    global track, collision_backend, ai_driver, continuous
+    track = get_track(path)
+    collision_backend = backend
+    ai_driver = ai
+    continuous = ccd
+
+
+def make_ai():
+    # None drives every car with Car.update_ai
+    if ai_driver == "racing-line":
+        return track.racing_line_ai(collision_backend)
+    if ai_driver == "batch":
+        from ai_path import WaypointAI
+        return WaypointAI(track.ai_waypoints)
+    return None
+
+
+def run_race(job):
+    seed, waypoint_sets, cars_per_set, laps, max_time, jitter, turn = job
+    # the physics is deterministic, the seed shuffles the grid and moves
+    # and turns every car a little so every race is its own sample
+    rng = random.Random(seed)
+    ai_types = [ai_type for ai_type in waypoint_sets for i in range(cars_per_set)]
+    rng.shuffle(ai_types)
+
+    world = CarWorld(capacity=len(ai_types))
+    players = []
+    for ai_type, (x, y) in zip(ai_types, track.spawn_grid(len(ai_types))):
+        position = [x + rng.uniform(-jitter, jitter), y + rng.uniform(-jitter, jitter)]
+        players.append(Car(world, position=position, angle=-180 + rng.uniform(-turn, turn),
+                           car_type=ai_type % 4, is_ai=True, ai_type=ai_type))
+    # the walls and their index are built once per worker
+    walls = track.collider(collision_backend)
+    simulation = Simulation(world, players, walls, track.finishline, track.ai_waypoints, ai=make_ai(),
+                            ccd=SweptCollision(walls) if continuous else None)
+
+    max_ticks = int(max_time / simulation.timestep)
+    winner = None
+    while simulation.tick < max_ticks:
+        simulation.step()
+        leader = int(world.score[:world.count].argmax())
+        if world.score[leader] >= laps:
+            winner = leader
+            break
+
+    cars = []
+    for i, ai_type in enumerate(ai_types):
+        ticks = simulation.lap_ticks[i]
+        # the first crossing starts the first lap
+        lap_times = [(b - a) * simulation.timestep for a, b in zip(ticks, ticks[1:])]
+        cars.append({
+            "ai_type": ai_type,
+            "lap_times": lap_times,
+            "wall_hits": simulation.wall_hits[i],
+            "car_hits": simulation.car_hits[i],
+        })
+    return {
+        "seed": seed,
+        "ticks": simulation.tick,
+        "winner": None if winner is None else ai_types[winner],
+        "cars": cars,
+    }
+
+
+def summarize(results, waypoint_sets):
+    summary = {}
+    for ai_type in waypoint_sets:
+        cars = [car for result in results for car in result["cars"] if car["ai_type"] == ai_type]
+        lap_times = [lap for car in cars for lap in car["lap_times"]]
+        summary[ai_type] = {
+            "races": len(results),
+            "wins": sum(1 for result in results if result["winner"] == ai_type),
+            "laps": len(lap_times),
+            "best_lap": min(lap_times) if lap_times else None,
+            "mean_lap": statistics.mean(lap_times) if lap_times else None,
+            "median_lap": statistics.median(lap_times) if lap_times else None,
+            "wall_hits_per_car": statistics.mean(car["wall_hits"] for car in cars) if cars else 0,
+            "car_hits_per_car": statistics.mean(car["car_hits"] for car in cars) if cars else 0,
+        }
+    return summary
+
+
+def distinct_races(results):
+    # races that played out exactly the same count once
+    return len({json.dumps([result["ticks"], result["cars"]]) for result in results})
+
+
+def print_summary(summary, races, elapsed, distinct):
+    def seconds(value):
+        return "-" if value is None else f"{value:.2f}"
+
+    print(f"{races} races ({distinct} different) in {elapsed:.1f} s")
+    print(f"{'set':>4} {'wins':>6} {'win %':>7} {'laps':>6} {'best':>7} {'mean':>7} {'median':>7} {'wall hits':>10} {'car hits':>9}")
+    for ai_type, stats in summary.items():
+        print(f"{ai_type:>4} {stats['wins']:>6} {stats['wins'] / max(stats['races'], 1) * 100:>6.1f}% {stats['laps']:>6}"
+              f" {seconds(stats['best_lap']):>7} {seconds(stats['mean_lap']):>7} {seconds(stats['median_lap']):>7}"
+              f" {stats['wall_hits_per_car']:>10.1f} {stats['car_hits_per_car']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run AI-only races without a window")
+    parser.add_argument("--races", type=int, default=100)
+    parser.add_argument("--track", default=track_path, help="track file to race on")
+    parser.add_argument("--sets", type=int, nargs="+",
+                        help="ai_waypoints indices that take part, all of them by default")
+    parser.add_argument("--cars-per-set", type=int, default=1)
+    parser.add_argument("--laps", type=int, default=3)
+    parser.add_argument("--max-time", type=float, default=600,
+                        help="simulated seconds before a race is stopped")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--collision", choices=["python", "numpy", "sdf"], default="python")
+    parser.add_argument("--ai", choices=["waypoints", "batch", "racing-line"], default="waypoints",
+                        help="steer to the next waypoint (per car, or batch for all cars at once),"
+                        " or follow the racing line splines")
+    parser.add_argument("--ccd", action="store_true",
+                        help="sweep fast cars against the walls in substeps")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jitter", type=float, default=20,
+                        help="pixels every car is moved at random from its grid slot")
+    parser.add_argument("--turn", type=float, default=2,
+                        help="degrees every car is turned at random on the grid")
+    parser.add_argument("--json", help="write every race result and the summary here")
+    args = parser.parse_args()
+    if args.sets is None:
+        args.sets = [i for i, path in enumerate(get_track(args.track).ai_waypoints) if path]
+
+    # build the distance field once here so the workers only read the cache
+    if args.collision == "sdf":
+        get_track(args.track).collider("sdf")
+
+    jobs = [(args.seed + i, args.sets, args.cars_per_set, args.laps, args.max_time, args.jitter, args.turn)
+            for i in range(args.races)]
+    start = time.perf_counter()
+    with Pool(args.processes, initializer=init_worker, initargs=(args.collision, args.ai, args.ccd, args.track)) as pool:
+        chunksize = max(1, len(jobs) // (args.processes * 4))
+        results = list(pool.imap_unordered(run_race, jobs, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+    results.sort(key=lambda result: result["seed"])
+
+    summary = summarize(results, args.sets)
+    print_summary(summary, len(results), elapsed, distinct_races(results))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"summary": summary, "races": results}, file, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+import argparse
+import bisect
+import mmap
+import os
+import struct
+import time
+import zlib
+from car import Car, CarWorld
+from simulation import Simulation
+from track import track_path, get_track
+from track_sdf import walls_hash
+from protocol import input_bits, input_list
+
+# race replays. the simulation is deterministic, so a race is its first
+# state and the keys every car held: the file starts with a header and
+# the CarWorld state at tick 0, after that one small record every time a
+# car's keys change, and a last record with the final tick and a checksum
+# of the final state. AI cars need no records at all. the header also
+# names the track file, a hash of its walls and the collision backend, a
+# replay only plays back on the same ones.
+#
+# next to it, race.rpl.ckpt holds the full CarWorld state every
+# `interval` ticks as fixed size records, so checkpoint k is at a known
+# offset. seeking memory maps it, loads the checkpoint before the tick and
+# only simulates the ticks after it.
+#
+# python replay.py race.rpl              replay as fast as possible and check it
+# python replay.py race.rpl --checkpoints 600 --seek 300
+#                                        add checkpoints, then time a seek
+# python main.py --replay race.rpl       watch it, left/right arrows seek
+
+magic = b"RPL1"
+version = 3
+# magic, version, timestep, seed, car count
+header = struct.Struct("<4sIdQI")
+# since version 2: collision backend, walls hash, track path length, then
+# the track path
+track_header = struct.Struct("<8s16sH")
+# tick, car, input bits
+record = struct.Struct("<IHB")
+# car number of the last record, its bits are unused
+end_car = 0xFFFF
+# before version 3 the car was a single byte
+byte_record = struct.Struct("<IBB")
+byte_end_car = 0xFF
+checksum = struct.Struct("<I")
+
+checkpoint_magic = b"CKP1"
+# magic, interval in ticks, car count
+checkpoint_header = struct.Struct("<4sII")
+# tick, followed by CarWorld.state()
+checkpoint_tick = struct.Struct("<I")
+
+
+def state_checksum(world):
+    return zlib.crc32(world.state())
+
+
+class CheckpointWriter():
+    def __init__(self, path, interval, count, buffer_size=1 << 16) -> None:
+        self.file = open(path, "wb", buffering=buffer_size)
+        self.file.write(checkpoint_header.pack(checkpoint_magic, interval, count))
+        self.interval = interval
+        self.written = 0
+
+    def write(self, tick, world):
+        # checkpoints have to come in order, one per interval
+        if tick != self.written * self.interval:
+            return
+        self.file.write(checkpoint_tick.pack(tick))
+        self.file.write(world.state())
+        self.written += 1
+
+    def close(self):
+        self.file.close()
+
+
+class Checkpoints():
+    def __init__(self, path) -> None:
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        file_magic, self.interval, count = checkpoint_header.unpack_from(self.data)
+        if file_magic != checkpoint_magic:
+            raise ValueError(f"{path} is not a checkpoint file")
+        self.record_size = checkpoint_tick.size + CarWorld.state_size(count)
+        self.count = (len(self.data) - checkpoint_header.size) // self.record_size
+
+    def before(self, tick):
+        # (tick, state) of the last checkpoint at or before `tick`
+        index = min(tick // self.interval, self.count - 1)
+        offset = checkpoint_header.size + index * self.record_size
+        checkpoint = checkpoint_tick.unpack_from(self.data, offset)[0]
+        start = offset + checkpoint_tick.size
+        return checkpoint, memoryview(self.data)[start:offset + self.record_size]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+class Recorder():
+    def __init__(self, path, world, timestep, track, collision, seed=0, checkpoint_every=600,
+                 buffer_size=1 << 16) -> None:
+        # track is the track.Track of the race, collision the name of
+        # its wall backend. writes go through a buffer, a step only costs
+        # a compare per car
+        if world.count >= end_car:
+            raise ValueError(f"a replay holds at most {end_car} cars, not {world.count}")
+        self.file = open(path, "wb", buffering=buffer_size)
+        self.file.write(header.pack(magic, version, timestep, seed, world.count))
+        name = track.path.encode()
+        self.file.write(track_header.pack(collision.encode(), walls_hash(track.walls()).encode(), len(name)))
+        self.file.write(name)
+        self.file.write(world.state())
+        self.last = [[] for i in range(world.count)]
+        self.world = world
+        self.checkpoints = None
+        if checkpoint_every:
+            self.checkpoints = CheckpointWriter(path + ".ckpt", checkpoint_every, world.count)
+
+    def record(self, tick, inputs):
+        for car, held in enumerate(inputs):
+            if held != self.last[car]:
+                self.last[car] = held
+                self.file.write(record.pack(tick, car, input_bits(held)))
+        if self.checkpoints is not None and tick % self.checkpoints.interval == 0:
+            self.checkpoints.write(tick, self.world)
+
+    def close(self, world, tick):
+        if self.file.closed:
+            return
+        self.file.write(record.pack(tick, end_car, 0))
+        self.file.write(checksum.pack(state_checksum(world)))
+        self.file.close()
+        if self.checkpoints is not None:
+            self.checkpoints.close()
+
+
+class Replay():
+    def __init__(self, path) -> None:
+        with open(path, "rb") as file:
+            data = file.read()
+        file_magic, file_version, self.timestep, self.seed, self.count = header.unpack_from(data)
+        if file_magic != magic:
+            raise ValueError(f"{path} is not a replay")
+        offset = header.size
+        # None for recordings from before version 2, they play on
+        # whatever they are given
+        self.collision = self.track_path = self.walls_hash = None
+        if file_version >= 2:
+            collision, hash, length = track_header.unpack_from(data, offset)
+            offset += track_header.size
+            self.collision = collision.rstrip(b"\0").decode()
+            self.walls_hash = hash.decode()
+            self.track_path = data[offset:offset + length].decode()
+            offset += length
+        size = CarWorld.state_size(self.count)
+        self.initial_state = data[offset:offset + size]
+        offset += size
+
+        # (tick, car, bits) in the order they were written
+        change, last_car = (record, end_car) if file_version >= 3 else (byte_record, byte_end_car)
+        self.changes = []
+        self.end_tick = None
+        self.end_checksum = None
+        while offset + change.size <= len(data):
+            tick, car, bits = change.unpack_from(data, offset)
+            offset += change.size
+            if car == last_car:
+                self.end_tick = tick
+                if offset + checksum.size <= len(data):
+                    self.end_checksum = checksum.unpack_from(data, offset)[0]
+                break
+            self.changes.append((tick, car, bits))
+        if self.end_tick is None:
+            # the race did not end cleanly, play what there is
+            self.end_tick = self.changes[-1][0] if self.changes else 0
+        self.change_ticks = [change[0] for change in self.changes]
+        self.next_change = 0
+        self.checkpoints = None
+        if os.path.exists(path + ".ckpt"):
+            self.checkpoints = Checkpoints(path + ".ckpt")
+
+    def check(self, track, collision):
+        # a race played on other walls or another backend goes its own
+        # way from the first tick
+        if self.collision is not None and collision != self.collision:
+            raise ValueError(f"the race was recorded with the {self.collision} collision backend, not {collision}")
+        if self.walls_hash is not None and walls_hash(track.walls()) != self.walls_hash:
+            raise ValueError(f"the race was recorded on other walls than the ones in {track.path}")
+
+    def build(self, walls, finishline, ai_waypoints, car_class=Car, sounds=None):
+        # a Simulation at tick 0 that takes its inputs from this replay
+        world = CarWorld(capacity=self.count)
+        players = [car_class(world) for i in range(self.count)]
+        world.load_state(self.initial_state)
+        simulation = Simulation(world, players, walls, finishline, ai_waypoints,
+                                timestep=self.timestep, sounds=sounds)
+        simulation.replay = self
+        self.next_change = 0
+        return simulation
+
+    def apply(self, simulation):
+        # set the keys that change at this tick, called by Simulation.step
+        changes = self.changes
+        while self.next_change < len(changes) and changes[self.next_change][0] <= simulation.tick:
+            tick, car, bits = changes[self.next_change]
+            simulation.inputs[car] = input_list(bits)
+            self.next_change += 1
+
+    def restore(self, simulation, state, tick):
+        # put the simulation at `tick` with the given world state
+        world = simulation.world
+        world.load_state(state)
+        simulation.tick = tick
+        simulation.accumulator = 0.0
+        simulation.previous_position = world.position[:world.count].copy()
+        simulation.previous_angle = world.angle[:world.count].copy()
+        # the keys held at that tick
+        simulation.inputs = [[] for i in range(self.count)]
+        self.next_change = bisect.bisect_left(self.change_ticks, tick)
+        for car_tick, car, bits in self.changes[:self.next_change]:
+            simulation.inputs[car] = input_list(bits)
+
+    def seek(self, simulation, tick):
+        # the hit counters and lap ticks only count what was simulated
+        tick = min(max(tick, 0), self.end_tick)
+        checkpoint, state = 0, self.initial_state
+        if self.checkpoints is not None and self.checkpoints.count:
+            checkpoint, state = self.checkpoints.before(tick)
+        if tick < simulation.tick or checkpoint > simulation.tick:
+            self.restore(simulation, state, checkpoint)
+        sounds = simulation.sounds
+        simulation.sounds = None
+        while simulation.tick < tick:
+            simulation.step()
+        simulation.sounds = sounds
+
+    def finished(self, simulation):
+        return simulation.tick >= self.end_tick
+
+    def matches(self, simulation):
+        # None when the recording has no checksum
+        if self.end_checksum is None or simulation.tick != self.end_tick:
+            return None
+        return state_checksum(simulation.world) == self.end_checksum
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay a race without a window")
+    parser.add_argument("path")
+    parser.add_argument("--collision", choices=["python", "numpy", "sdf"],
+                        help="wall collision backend, the recorded one by default")
+    parser.add_argument("--track", help="track file, the recorded one by default")
+    parser.add_argument("--checkpoints", type=int, default=0,
+                        help="write race.rpl.ckpt with a checkpoint every this many ticks")
+    parser.add_argument("--seek", type=float,
+                        help="seconds into the race to seek to, timed")
+    args = parser.parse_args()
+
+    replay = Replay(args.path)
+    collision = args.collision or replay.collision or "python"
+    track = get_track(args.track or replay.track_path or track_path)
+    try:
+        replay.check(track, collision)
+    except ValueError as error:
+        parser.error(str(error))
+    simulation = replay.build(track.collider(collision), track.finishline, track.ai_waypoints)
+    checkpoints = None
+    if args.checkpoints:
+        if replay.checkpoints is not None:
+            replay.checkpoints.close()
+            replay.checkpoints = None
+        checkpoints = CheckpointWriter(args.path + ".ckpt", args.checkpoints, replay.count)
+
+    start = time.perf_counter()
+    while simulation.tick < replay.end_tick:
+        if checkpoints is not None:
+            checkpoints.write(simulation.tick, simulation.world)
+        simulation.step()
+    elapsed = time.perf_counter() - start
+    if checkpoints is not None:
+        checkpoints.close()
+        replay.checkpoints = Checkpoints(args.path + ".ckpt")
+        print(f"wrote {checkpoints.written} checkpoints")
+    print(f"{replay.count} cars, {len(replay.changes)} input changes, {replay.end_tick} ticks "
+          f"in {elapsed:.2f} s ({replay.end_tick / max(elapsed, 1e-9):.0f} ticks/s)")
+    print("scores:", simulation.world.score[:replay.count].tolist())
+    result = replay.matches(simulation)
+    if result is None:
+        print("no checksum in the recording")
+    elif result:
+        print("final state matches the recording")
+    else:
+        print("final state does NOT match the recording")
+        raise SystemExit(1)
+
+    if args.seek is not None:
+        # from the start, so the checkpoint is what makes it fast
+        target = int(args.seek / replay.timestep)
+        replay.restore(simulation, replay.initial_state, 0)
+        start = time.perf_counter()
+        replay.seek(simulation, target)
+        elapsed = time.perf_counter() - start
+        print(f"seek to tick {simulation.tick} took {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,374 @@
-import socket
-from _thread import *
-import sys
+import argparse
+import asyncio
+import struct
+import time
+from collections import OrderedDict, deque
+from car import Car, CarWorld
+from simulation import Simulation
+import protocol
+from track import track_path, get_track
+from interest import InterestGrid, ClientView
 
+# authoritative race server. one asyncio process hosts many rooms, every
+# room runs its own fixed timestep Simulation and sends a snapshot of all
+# cars in it to all of its clients at `snapshot_rate` per second.
+#
+# the messages are the binary frames from protocol.py:
+#   server: hello on connect, with the precision of the snapshots
+#   client: join <room> <track>        -> server: id <car> <track>
+#   client: input <sequence> <keys>    (the keys held down, as bits)
+#   server: delta <tick> <cars changed since the acknowledged snapshot>
+#   client: ack <tick>
+#   server: scores <car> <score> ...     (when a score changes)
+#
+# with an InterestGrid every client only hears about the cars around its
+# own car, see interest.py. a server can offer several track files, a
+# client picks one when it joins or gets the first. rooms on the same
+# track share it through the track cache.
+#
+# python server.py --host 0.0.0.0 --port 5555
 
-server = "192.168.1.30"
-port = 5555
 
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+class Room():
+    def __init__(self, name, track, tick_rate, snapshot_rate, max_cars, quantizer, delta=True, interest=None) -> None:
+        self.name = name
+        self.track = track
+        self.max_cars = max_cars
+        self.world = CarWorld(capacity=max_cars)
+        self.simulation = Simulation(self.world, [], track.collider(), track.finishline,
+                                     track.ai_waypoints, timestep=1 / tick_rate)
+        self.snapshot_every = max(1, round(tick_rate / snapshot_rate))
+        self.grid = track.spawn_grid(max_cars)
+        # car index: StreamWriter
+        self.clients = {}
+        # held keys and last input sequence per car, and the inputs that
+        # arrived but were not used yet. every step uses at most one input
+        # per car, the same as the client that predicts its own car.
+        self.bits = []
+        self.sequences = []
+        self.pending = []
+        self.max_pending = 8
+        # the scores the clients know, per car
+        self.scores = []
+        self.quantizer = quantizer
+        self.delta = delta
+        # tick: quantized cars, the snapshots a client can acknowledge
+        self.history = OrderedDict()
+        self.max_history = 64
+        # car index: last tick its client acknowledged
+        self.acks = {}
+        # or with interest management, car index: ClientView
+        self.interest = interest
+        self.views = {}
+        self.snapshot_count = 0
+        self.bytes_sent = 0
+        self.task = None
 
-try:
-    s.bind((server, port))
-except socket.error as e:
-    str(e)
+    def is_full(self):
+        return len(self.simulation.players) >= self.max_cars
 
-s.listen(2)
-print("Waiting for a connection, Server Started")
+    def join(self, writer):
+        car_count = len(self.simulation.players)
+        player = Car(self.world, position=self.grid[car_count], angle=-180,
+                     car_type=car_count % 4)
+        car = self.simulation.add_player(player)
+        self.clients[car] = writer
+        self.views[car] = ClientView(self.max_history)
+        self.bits.append(0)
+        self.sequences.append(0)
+        self.scores.append(None)
+        self.pending.append(deque())
+        return car
 
-def threaded_client(conn):
-    conn.send(str.encode("Connected"))
-    reply = ""
+    def leave(self, car):
+        # the car stays in the race and an AI drives it from now on
+        self.clients.pop(car, None)
+        self.acks.pop(car, None)
+        self.views.pop(car, None)
+        player = self.simulation.players[car]
+        player.is_ai = True
+        ai_waypoints = self.track.ai_waypoints
+        player.ai_type = car % (len(ai_waypoints) - 1) + 1
+        # start from the closest waypoint so it does not drive back
+        path = ai_waypoints[player.ai_type]
+        x, y = player.position
+        player.waypoint_index = min(range(len(path)),
+                                    key=lambda i: (path[i][0] - x) ** 2 + (path[i][1] - y) ** 2)
+        player.teleport_timer = 5
+        self.bits[car] = 0
+        self.pending[car].clear()
+        self.simulation.set_inputs(car, [])
 
-    connected = True
-    while connected:
+    def set_input(self, car, sequence, bits):
+        # inputs can arrive out of order, older ones are ignored
+        pending = self.pending[car]
+        last = pending[-1][0] if pending else self.sequences[car]
+        if sequence <= last:
+            return
+        pending.append((sequence, bits))
+        if len(pending) > self.max_pending:
+            # a client that sends too fast drops its oldest inputs
+            pending.popleft()
+
+    def use_inputs(self):
+        for car, pending in enumerate(self.pending):
+            if not pending:
+                continue
+            sequence, bits = pending.popleft()
+            self.sequences[car] = sequence
+            if bits != self.bits[car]:
+                self.bits[car] = bits
+                self.simulation.set_inputs(car, protocol.input_list(bits))
+
+    def acknowledge(self, car, tick):
+        if self.interest is not None:
+            if car in self.views:
+                self.views[car].acknowledge(tick)
+        elif tick in self.history and tick > self.acks.get(car, 0):
+            self.acks[car] = tick
+
+    def scores_message(self):
+        # every score, for a client that just joined
+        return protocol.encode_scores(list(enumerate(self.world.score[:len(self.scores)].tolist())))
+
+    def send_scores(self):
+        scores = self.world.score[:len(self.scores)].tolist()
+        if scores == self.scores:
+            return
+        changed = [(car, score) for car, (score, old) in enumerate(zip(scores, self.scores)) if score != old]
+        self.scores = scores
+        data = protocol.encode_scores(changed)
+        for writer in self.clients.values():
+            writer.write(data)
+            self.bytes_sent += len(data)
+
+    def snapshot(self):
+        tick = self.simulation.tick
+        cars = self.quantizer.quantize(self.world, len(self.simulation.players), self.bits, self.sequences)
+        self.history[tick] = cars
+        if len(self.history) > self.max_history:
+            self.history.popitem(last=False)
+        return tick, cars
+
+    def broadcast(self, tick, cars):
+        self.snapshot_count += 1
+        if self.interest is not None:
+            self.broadcast_nearby(tick, cars)
+            return
+        # one message per acknowledged tick, clients that acknowledged the
+        # same snapshot get the same bytes
+        messages = {}
+        angle_steps = self.quantizer.angle_steps
+        for car, writer in list(self.clients.items()):
+            # a client that can not keep up misses snapshots instead of
+            # making the server buffer them
+            if writer.transport.get_write_buffer_size() >= 64 * 1024:
+                continue
+            base_tick = self.acks.get(car, 0) if self.delta else 0
+            if base_tick not in self.history:
+                base_tick = 0
+            data = messages.get(base_tick)
+            if data is None:
+                data = protocol.encode_delta(tick, cars, base_tick, self.history.get(base_tick), angle_steps)
+                messages[base_tick] = data
+            writer.write(data)
+            self.bytes_sent += len(data)
+
+    def broadcast_nearby(self, tick, cars):
+        # every client its own message with the cars around it
+        angle_steps = self.quantizer.angle_steps
+        self.interest.build(self.world.position[:len(cars)].tolist())
+        for car, writer in list(self.clients.items()):
+            if writer.transport.get_write_buffer_size() >= 64 * 1024:
+                continue
+            view = self.views[car]
+            if not self.delta:
+                view.ack = 0
+            relevant, keep = self.interest.relevant(car, self.snapshot_count)
+            base_tick, base, cars_seen, check = view.next_view(tick, cars, relevant, keep)
+            data = protocol.encode_delta(tick, cars_seen, base_tick, base, angle_steps, check)
+            writer.write(data)
+            self.bytes_sent += len(data)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        timestep = self.simulation.timestep
+        next_tick = loop.time()
+        while self.clients:
+            self.use_inputs()
+            self.simulation.step()
+            self.send_scores()
+            if self.simulation.tick % self.snapshot_every == 0:
+                self.broadcast(*self.snapshot())
+            next_tick += timestep
+            delay = next_tick - loop.time()
+            if delay < -timestep * self.simulation.max_steps:
+                # too far behind, skip ahead instead of catching up
+                next_tick = loop.time()
+                delay = 0
+            await asyncio.sleep(max(delay, 0))
+
+
+class RaceServer():
+    def __init__(self, tick_rate=60, snapshot_rate=20, max_cars=8, quantizer=None, delta=True, interest=None,
+                 track=track_path, tracks=()) -> None:
+        self.tick_rate = tick_rate
+        self.snapshot_rate = snapshot_rate
+        self.max_cars = max_cars
+        self.quantizer = quantizer or protocol.Quantizer()
+        self.delta = delta
+        self.interest = interest
+        # the track files clients can ask for, the first one is the default
+        self.track_paths = [track] + [path for path in tracks if path != track]
+        # (track file, name): Room
+        self.rooms = {}
+
+    def get_room(self, name, path=None):
+        path = path or self.track_paths[0]
+        if path not in self.track_paths:
+            raise ValueError(f"{path} is not a track of this server")
+        room = self.rooms.get((path, name))
+        if room is None or room.is_full():
+            if room is not None:
+                # full rooms overflow into name/2, name/3, ...
+                number = 2
+                while (path, f"{name}/{number}") in self.rooms and \
+                        self.rooms[(path, f"{name}/{number}")].is_full():
+                    number += 1
+                name = f"{name}/{number}"
+                room = self.rooms.get((path, name))
+            if room is None:
+                # the walls never change, every room on a track shares them
+                room = Room(name, get_track(path), self.tick_rate, self.snapshot_rate,
+                            self.max_cars, self.quantizer, self.delta, self.interest)
+                self.rooms[(path, name)] = room
+        return room
+
+    def close_room(self, room):
+        key = (room.track.path, room.name)
+        if not room.clients and self.rooms.get(key) is room:
+            del self.rooms[key]
+
+    def room_stopped(self, task):
+        # a room whose loop failed can not go on, its clients are
+        # disconnected instead of waiting for snapshots that never come
+        if task.cancelled() or task.exception() is None:
+            return
+        room = next((room for room in self.rooms.values() if room.task is task), None)
+        name = room.name if room is not None else "?"
+        print(f"room {name} stopped: {task.exception()!r}")
+        if room is not None:
+            del self.rooms[(room.track.path, room.name)]
+            for writer in room.clients.values():
+                writer.close()
+
+    async def handle_client(self, reader, writer):
+        writer.write(protocol.encode_hello(self.quantizer))
+        room = None
+        car = None
         try:
-            data = conn.recv(2048)
-            reply = data.decode("utf-8")
+            while True:
+                payload = await protocol.read_frame(reader)
+                if payload is None:
+                    break
+                kind, value = protocol.decode(payload)
+                if kind == protocol.JOIN and room is None:
+                    name, path = value
+                    room = self.get_room(name or "lobby", path)
+                    car = room.join(writer)
+                    writer.write(protocol.encode_id(car, room.track.path))
+                    writer.write(room.scores_message())
+                    if room.task is None:
+                        room.task = asyncio.create_task(room.run())
+                        room.task.add_done_callback(self.room_stopped)
+                elif kind == protocol.INPUT and room is not None:
+                    room.set_input(car, *value)
+                elif kind == protocol.ACK and room is not None:
+                    room.acknowledge(car, value)
+        except (ConnectionError, ValueError, struct.error, UnicodeDecodeError):
+            pass
+        finally:
+            if room is not None:
+                room.leave(car)
+                if not room.clients:
+                    self.close_room(room)
+            writer.close()
+
+    async def report(self, interval):
+        # outgoing bandwidth per client, to size servers by
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            clients = sum(len(room.clients) for room in self.rooms.values())
+            sent = sum(room.bytes_sent for room in self.rooms.values())
+            for room in self.rooms.values():
+                room.bytes_sent = 0
+            if clients:
+                print(f"{len(self.rooms)} rooms, {clients} clients, "
+                      f"{sent / (now - last) / clients:.0f} bytes/s per client")
+            last = now
 
-            if not data:
-                print("Disconnected")
-                connected = False
-            else:
-                print("Received: ", reply)
-                print("Sending: ", reply)
+    async def serve(self, host, port, stats_interval=0):
+        server = await asyncio.start_server(self.handle_client, host, port, backlog=1024)
+        print(f"Waiting for connections on {host}:{port}, Server Started")
+        if stats_interval > 0:
+            asyncio.create_task(self.report(stats_interval))
+        async with server:
+            await server.serve_forever()
 
-            conn.sendall(str.encode(reply))
-        except:
-            connected = False
 
+def main():
+    parser = argparse.ArgumentParser(description="authoritative race server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--tick-rate", type=int, default=60,
+                        help="simulation steps per second")
+    parser.add_argument("--snapshot-rate", type=int, default=20,
+                        help="snapshots per second sent to every client")
+    parser.add_argument("--max-cars", type=int, default=8,
+                        help="cars per room")
+    parser.add_argument("--position-step", type=float, default=0.125,
+                        help="precision of positions in world pixels")
+    parser.add_argument("--velocity-step", type=float, default=0.5)
+    parser.add_argument("--angle-steps", type=int, default=4096,
+                        help="steps in a full turn, at most 65536")
+    parser.add_argument("--no-delta", action="store_true",
+                        help="send every car in every snapshot")
+    parser.add_argument("--no-interest", action="store_true",
+                        help="send every client every car")
+    parser.add_argument("--view-margin", type=float, default=400,
+                        help="cars this far around a client's view are sent in every snapshot")
+    parser.add_argument("--far-radius", type=float, default=4000,
+                        help="cars up to this far away are sent less often, the rest not at all")
+    parser.add_argument("--far-every", type=int, default=4,
+                        help="far cars are sent in one of this many snapshots")
+    parser.add_argument("--track", default=track_path,
+                        help="track file of the clients that do not ask for one")
+    parser.add_argument("--tracks", nargs="*", default=[],
+                        help="more track files the clients can ask for")
+    parser.add_argument("--stats", type=float, default=0,
+                        help="print the bandwidth every this many seconds")
+    args = parser.parse_args()
+    if not 0 < args.max_cars <= protocol.max_cars:
+        parser.error(f"--max-cars has to be between 1 and {protocol.max_cars}")
+    try:
+        for path in [args.track] + args.tracks:
+            get_track(path).spawn_grid(args.max_cars)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    quantizer = protocol.Quantizer(args.position_step, args.velocity_step, args.angle_steps)
+    interest = None
+    if not args.no_interest:
+        interest = InterestGrid(margin=args.view_margin, far_radius=args.far_radius,
+                                far_every=args.far_every)
+    server = RaceServer(args.tick_rate, args.snapshot_rate, args.max_cars,
+                        quantizer, not args.no_delta, interest, args.track, args.tracks)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.stats))
+    except KeyboardInterrupt:
+        pass
 
-while True:
-    conn, addr = s.accept()
-    print("Connected to:", addr)
 
-    start_new_thread(threaded_client, (conn,))
\ No newline at end of file
+if __name__ == "__main__":
+    main()
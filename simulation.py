@@ -0,0 +1,150 @@
+import numpy as np
+from collision import CarHash
+from car import play_collision_sound
+
+# headless race simulation. the cars always advance in fixed steps of
+# `timestep` seconds, no matter how long a rendered frame took, so a race
+# plays out the same on every machine and can run faster than real time
+# on a server or in tests. nothing in here touches pygame.
+
+
+class Simulation():
+    def __init__(self, world, players, walls, finishline, ai_waypoints, timestep=1 / 60, max_steps=8, sounds=None, ai=None, ccd=None) -> None:
+        self.world = world
+        self.players = players
+        self.walls = walls
+        self.finishline = finishline
+        self.ai_waypoints = ai_waypoints
+        self.timestep = timestep
+        # a very slow frame only catches up this many steps, the rest of
+        # the time is dropped instead of making the next frame slower
+        self.max_steps = max_steps
+        self.sounds = sounds
+        # drives every AI car at once (like ai_path.RacingLineAI) instead
+        # of Car.update_ai per car
+        self.ai = ai
+        # ccd.SweptCollision, so fast cars can not pass through the walls
+        self.ccd = ccd
+        self.car_hash = CarHash(2.5 * max([player.radius for player in players], default=40))
+        self.rows = [player.index for player in players]
+
+        self.tick = 0
+        self.accumulator = 0.0
+        self.inputs = [[] for player in players]
+        self.wall_hits = [0 for player in players]
+        self.car_hits = [0 for player in players]
+        # tick of every finish line crossing, per car
+        self.lap_ticks = [[] for player in players]
+        self.previous_position = world.position[:world.count].copy()
+        self.previous_angle = world.angle[:world.count].copy()
+        # replay.Recorder writes the inputs of every step, replay.Replay
+        # sets them
+        self.recorder = None
+        self.replay = None
+        # profiler.FrameProfiler, times the stages of every step
+        self.profiler = None
+
+    def add_player(self, player):
+        # a car that joins a running race, it has to be in the same world
+        self.players.append(player)
+        self.inputs.append([])
+        self.wall_hits.append(0)
+        self.car_hits.append(0)
+        self.lap_ticks.append([])
+        self.rows.append(player.index)
+        self.car_hash.cell_size = max(self.car_hash.cell_size, 2.5 * player.radius)
+        self.previous_position = self.world.position[:self.world.count].copy()
+        self.previous_angle = self.world.angle[:self.world.count].copy()
+        return len(self.players) - 1
+
+    def set_inputs(self, car, inputs):
+        # inputs ("up", "left", ...) held until they are changed again
+        self.inputs[car] = list(inputs)
+
+    def step(self):
+        dt = self.timestep
+        world = self.world
+        players = self.players
+        self.previous_position = world.position[:world.count].copy()
+        self.previous_angle = world.angle[:world.count].copy()
+
+        if self.replay is not None:
+            self.replay.apply(self)
+        if self.recorder is not None:
+            self.recorder.record(self.tick, self.inputs)
+        for player, inputs in zip(players, self.inputs):
+            for input in inputs:
+                player.handle_user_input(input, dt)
+
+        scores = world.score[:world.count].copy()
+        if self.ccd is not None:
+            start = world.position[:world.count].copy()
+        world.integrate(dt)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.lap("step")
+        if self.ccd is not None:
+            collided = self.ccd.collide(players, start)
+        else:
+            collided = self.walls.collide(players)
+        if profiler is not None:
+            profiler.lap("walls")
+        # while profiling Car.update_ai runs after the other cars are
+        # updated, so it is timed on its own. it only moves its own car.
+        drive_ai = self.ai is None and profiler is None
+        for i, player in enumerate(players):
+            if collided[i]:
+                self.wall_hits[i] += 1
+            player.update_after_collision(
+                dt, collided[i], self.finishline, self.ai_waypoints, players, self.sounds,
+                drive_ai=drive_ai)
+        if profiler is not None:
+            profiler.lap("cars")
+            if self.ai is None:
+                for player in players:
+                    if player.is_ai:
+                        player.update_ai(dt, self.ai_waypoints)
+        if self.ai is not None:
+            self.ai.update(world, dt)
+        if profiler is not None:
+            profiler.lap("ai")
+
+        # every pair of cars is resolved once per step
+        for a, b in self.car_hash.pairs(world.position[self.rows].tolist()):
+            if players[a].handle_player_collision(players[b]):
+                self.car_hits[a] += 1
+                self.car_hits[b] += 1
+                play_collision_sound(
+                    self.sounds, "collision_car_car", players, players[a].position)
+        self.tick += 1
+        for i in np.flatnonzero(world.score[:world.count] != scores):
+            self.lap_ticks[i].append(self.tick)
+        if profiler is not None:
+            profiler.lap("car-car")
+
+    def run(self, steps):
+        for i in range(steps):
+            self.step()
+
+    def advance(self, frame_time):
+        # run as many fixed steps as fit in the elapsed time and return how
+        # far we are into the next one (0..1) for interpolate()
+        self.accumulator += frame_time
+        steps = 0
+        while self.accumulator >= self.timestep:
+            if steps == self.max_steps:
+                self.accumulator = 0.0
+                break
+            self.step()
+            self.accumulator -= self.timestep
+            steps += 1
+        return self.accumulator / self.timestep
+
+    def interpolate(self, alpha):
+        # positions and angles between the last two steps, for rendering
+        count = self.world.count
+        position = self.previous_position + \
+            (self.world.position[:count] - self.previous_position) * alpha
+        difference = (self.world.angle[:count] - self.previous_angle + 180) % 360 - 180
+        angle = self.previous_angle + difference * alpha
+        return position, angle
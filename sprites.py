@@ -0,0 +1,54 @@
+import math
+from collections import OrderedDict
+import pygame
+
+# rotated car sprites, so pygame.transform.rotate does not run for every
+# car every frame. angles are rounded to `step` degrees and every
+# rotation is made once, the first time it is needed (or all of them up
+# front with preload). the least recently used ones are dropped once there
+# are more than max_entries.
+
+
+class RotatedSprites():
+    def __init__(self, images, pivot, step=2, max_entries=720, preload=False) -> None:
+        self.images = images
+        # pivot in image coordinates, the point that ends up on the car position
+        self.pivot = pivot
+        self.step = step
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+        if preload:
+            self.max_entries = max(max_entries, len(images) * round(360 / step))
+            for image_index in range(len(images)):
+                for i in range(round(360 / step)):
+                    self.get(image_index, i * step)
+
+    def make(self, image_index, angle):
+        image = self.images[image_index]
+        rotated_image = pygame.transform.rotate(image, angle)
+        # offset from pivot to center, rotated along with the image
+        center_x = image.get_width() / 2 - self.pivot[0]
+        center_y = image.get_height() / 2 - self.pivot[1]
+        radians = math.radians(angle)
+        offset_x = center_x * math.cos(radians) + center_y * math.sin(radians)
+        offset_y = -center_x * math.sin(radians) + center_y * math.cos(radians)
+        # from the pivot to the top left corner of the rotated image
+        return rotated_image, (offset_x - rotated_image.get_width() / 2,
+                               offset_y - rotated_image.get_height() / 2)
+
+    def get(self, image_index, angle):
+        angle = round(angle / self.step) * self.step % 360
+        key = (image_index, angle)
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = self.make(image_index, angle)
+            self.cache[key] = entry
+            if len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        return entry
+
+    def blit(self, surf, image_index, pos, angle):
+        rotated_image, offset = self.get(image_index, angle)
+        surf.blit(rotated_image, (round(pos[0] + offset[0]), round(pos[1] + offset[1])))
@@ -0,0 +1,84 @@
+import math
+from collections import OrderedDict
+import pygame
+
+# the track and the tire marks on it, cut into square tiles instead of one
+# 15360x8640 surface. a tile only gets its own surface once a tire mark is
+# drawn on it, every other tile is a scaled piece of the racetrack image
+# that is made when it comes into view and kept in a small LRU cache.
+# tiles past the edge of the racetrack image all share one black tile.
+
+
+class TireMarkLayer():
+    def __init__(self, racetrack, scale, world_size=None, tile_pixels=40, alpha=200, max_base_tiles=64) -> None:
+        # world_size is in racetrack pixels, the whole image by default
+        self.racetrack = racetrack
+        world_size = world_size or racetrack.get_size()
+        self.scale = scale
+        # tile size in racetrack pixels and in world pixels
+        self.tile_pixels = tile_pixels
+        self.tile_size = tile_pixels * scale
+        self.columns = math.ceil(world_size[0] / tile_pixels)
+        self.rows = math.ceil(world_size[1] / tile_pixels)
+        self.alpha = alpha
+        self.max_base_tiles = max_base_tiles
+        self.base_tiles = OrderedDict()
+        self.tiles = {}
+
+        self.empty_tile = pygame.Surface((self.tile_size, self.tile_size))
+        self.empty_tile.set_alpha(alpha)
+
+    def make_base_tile(self, tx, ty):
+        rect = pygame.Rect(tx * self.tile_pixels, ty * self.tile_pixels,
+                           self.tile_pixels, self.tile_pixels)
+        source = rect.clip(self.racetrack.get_rect())
+        if source.width == 0 or source.height == 0:
+            return self.empty_tile
+        tile = pygame.Surface((self.tile_size, self.tile_size))
+        piece = pygame.transform.scale(self.racetrack.subsurface(source),
+                                       (source.width * self.scale, source.height * self.scale))
+        tile.blit(piece, ((source.x - rect.x) * self.scale, (source.y - rect.y) * self.scale))
+        tile.set_alpha(self.alpha)
+        return tile
+
+    def base_tile(self, tx, ty):
+        key = (tx, ty)
+        tile = self.base_tiles.get(key)
+        if tile is None:
+            tile = self.make_base_tile(tx, ty)
+            self.base_tiles[key] = tile
+            if len(self.base_tiles) > self.max_base_tiles:
+                self.base_tiles.popitem(last=False)
+        else:
+            self.base_tiles.move_to_end(key)
+        return tile
+
+    def tile_range(self, x1, y1, x2, y2):
+        inverse = 1 / self.tile_size
+        for ty in range(max(math.floor(y1 * inverse), 0), min(math.floor(y2 * inverse), self.rows - 1) + 1):
+            for tx in range(max(math.floor(x1 * inverse), 0), min(math.floor(x2 * inverse), self.columns - 1) + 1):
+                yield tx, ty
+
+    def draw_circle(self, color, center, radius):
+        # pygame.draw.circle in world coordinates, split over the tiles it
+        # touches. pygame cuts the center down to whole pixels, do that in
+        # world coordinates so a circle lines up across tile edges.
+        x, y = int(center[0]), int(center[1])
+        for tx, ty in self.tile_range(x - radius, y - radius, x + radius, y + radius):
+            tile = self.tiles.get((tx, ty))
+            if tile is None:
+                tile = self.base_tile(tx, ty).copy()
+                tile.set_alpha(self.alpha)
+                self.tiles[(tx, ty)] = tile
+            pygame.draw.circle(tile, color, (x - tx * self.tile_size, y - ty * self.tile_size), radius, 0)
+
+    def blit(self, screen, camera_position):
+        # only the tiles inside the screen
+        width, height = screen.get_size()
+        camera_x, camera_y = int(camera_position[0]), int(camera_position[1])
+        for tx, ty in self.tile_range(-camera_x, -camera_y, width - camera_x, height - camera_y):
+            tile = self.tiles.get((tx, ty))
+            if tile is None:
+                tile = self.base_tile(tx, ty)
+            screen.blit(tile, (tx * self.tile_size + camera_x,
+                               ty * self.tile_size + camera_y))
@@ -0,0 +1,172 @@
+import math
+from collections import OrderedDict
+from collision import aabb_circle
+from track_file import TrackFile
+
+# race tracks. a Track is everything a race needs from one track file:
+# the image, the walls scaled to world coordinates, the collision backends
+# over them, the finish line, the starting grid and the racing lines. only
+# the track file is read when a Track is made, the rest is built the first
+# time it is asked for and then kept. the tracks themselves are kept in a
+# small LRU cache, so a server or lobby that goes back and forth between
+# tracks does not build the same walls and grids again.
+
+track_path = "src/tracks/racetrack.trk"
+
+
+class Track():
+    def __init__(self, path) -> None:
+        self.path = path
+        self.file = TrackFile(path)
+        self.scale = self.file.scale
+        self.row_spacing = self.file.row_spacing
+        self.image_path = self.file.image
+        self.finishline = self.file.finishline
+        self.grid_slots = self.file.grid_slots
+        self.ai_waypoints = self.file.ai_waypoints
+        # built when first used
+        self.scaled_walls = None
+        self.colliders = {}
+        self.surface = None
+        self.racing_lines = {}
+        self.spawn_slots = None
+
+    def walls(self):
+        # merged walls in world coordinates, shared by everything that uses
+        # this track so they must not be changed
+        if self.scaled_walls is None:
+            scale = self.scale
+            walls = self.file.walls()
+            for wall in walls:
+                wall.position[0] *= scale
+                wall.position[1] *= scale
+                wall.size[0] *= scale
+                wall.size[1] *= scale
+            self.scaled_walls = walls
+        return self.scaled_walls
+
+    def collider(self, backend="python"):
+        # the wall collision backend, "python", "numpy" or "sdf"
+        collider = self.colliders.get(backend)
+        if collider is None:
+            row_spacing = self.row_spacing * self.scale
+            if backend == "numpy":
+                from numpy_collision import NumpyWalls
+                collider = NumpyWalls(self.walls(), row_spacing=row_spacing)
+            elif backend == "sdf":
+                from track_sdf import SdfWalls
+                collider = SdfWalls(self.walls(), row_spacing=row_spacing)
+            else:
+                from collision import WallGrid
+                collider = WallGrid(self.walls(), row_spacing=row_spacing)
+            self.colliders[backend] = collider
+        return collider
+
+    def image(self):
+        # the track image as a pygame surface, in track pixels
+        if self.surface is None:
+            import pygame
+            self.surface = pygame.image.load(self.image_path)
+        return self.surface
+
+    def racing_line_ai(self, backend="python"):
+        # the racing lines, with the sdf backend they also see the walls
+        ai = self.racing_lines.get(backend)
+        if ai is None:
+            from ai_path import RacingLineAI
+            ai = RacingLineAI(self.ai_waypoints, field=getattr(self.collider(backend), "field", None))
+            self.racing_lines[backend] = ai
+        return ai
+
+    def spawn_grid(self, count):
+        # the starting grid from the track file, then rows behind it
+        if self.spawn_slots is None or len(self.spawn_slots) < count:
+            self.spawn_slots = [list(slot) for slot in self.grid_slots]
+            if count > len(self.spawn_slots):
+                self.spawn_slots += self.grid_rows(count - len(self.spawn_slots))
+        return [list(slot) for slot in self.spawn_slots[:count]]
+
+    def grid_rows(self, count, spacing=200, lane=120, reach=360, clearance=60):
+        # `count` more slots, in rows every `spacing` pixels backwards
+        # along the waypoint path that passes closest to the last grid
+        # slot. every row is centred on the clear width of the track there
+        # and holds up to three cars `lane` pixels apart. a slot is used
+        # when no wall is within `clearance` of it.
+        walls = self.collider()
+
+        def clear(x, y):
+            return not any(aabb_circle(wall.position[0], wall.position[1], wall.size[0], wall.size[1],
+                                       x, y, clearance)
+                           for wall in walls.query(x, y, clearance))
+
+        last = self.grid_slots[-1]
+        path = min((path for path in self.ai_waypoints if path),
+                   key=lambda path: min(math.dist(point, last) for point in path))
+        # driving goes up the path, so behind the grid is down it
+        start = min(range(len(path)), key=lambda i: math.dist(path[i], last))
+        points = [path[(start - i) % len(path)] for i in range(len(path) + 1)]
+
+        slots = []
+        taken = [tuple(slot) for slot in self.grid_slots]
+        distance = spacing
+        travelled = 0
+        for (x1, y1), (x2, y2) in zip(points, points[1:]):
+            segment = math.dist((x1, y1), (x2, y2))
+            if segment == 0:
+                continue
+            # left of the driving direction, which is from x2 to x1
+            nx, ny = (y1 - y2) / segment, (x2 - x1) / segment
+            while distance <= travelled + segment:
+                t = (distance - travelled) / segment
+                x, y = x1 + (x2 - x1) * t, y1 + (y2 - y1) * t
+                distance += spacing
+                # the clear stretch across the track around the path
+                offsets = [offset for offset in range(-reach, reach + 1, 20)
+                           if clear(x + nx * offset, y + ny * offset)]
+                runs = []
+                for offset in offsets:
+                    if runs and offset == runs[-1][-1] + 20:
+                        runs[-1].append(offset)
+                    else:
+                        runs.append([offset])
+                if not runs:
+                    continue
+                # the stretch the path is on, not the other side of a wall
+                run = min(runs, key=lambda run: max(run[0], -run[-1], 0))
+                middle = (run[0] + run[-1]) / 2
+                for offset in (middle, middle - lane, middle + lane):
+                    if not run[0] <= offset <= run[-1]:
+                        continue
+                    slot = (x + nx * offset, y + ny * offset)
+                    if any(math.dist(slot, other) < lane for other in taken):
+                        continue
+                    slots.append(list(slot))
+                    taken.append(slot)
+                    if len(slots) == count:
+                        return slots
+            travelled += segment
+        raise ValueError(f"{self.path} has room for {len(self.grid_slots) + len(slots)} cars")
+
+
+class TrackCache():
+    def __init__(self, capacity=4) -> None:
+        self.capacity = capacity
+        self.tracks = OrderedDict()
+
+    def get(self, path):
+        track = self.tracks.get(path)
+        if track is None:
+            track = Track(path)
+            self.tracks[path] = track
+            if len(self.tracks) > self.capacity:
+                self.tracks.popitem(last=False)
+        else:
+            self.tracks.move_to_end(path)
+        return track
+
+
+tracks = TrackCache()
+
+
+def get_track(path=track_path):
+    return tracks.get(path)
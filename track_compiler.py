@@ -0,0 +1,103 @@
+import hashlib
+import os
+import struct
+
+# the track boundary in src/game_data.py is stored as one-pixel-tall
+# scanline spans, one every 3 pixels. this merges the spans that sit
+# straight above each other (same x and width, next row down) into one
+# rectangle and caches the result so the game only has to load it.
+# WallGrid splits a rectangle back into its rows when a car gets close,
+# so the collision response stays exactly the same as with the spans.
+# src/game_data.py is only read by main(), loading a track does not
+# import it.
+#
+# run with: python track_compiler.py
+
+row_spacing = 3
+cache_dir = "src/cache"
+
+header = struct.Struct("<4sII")
+rect = struct.Struct("<iiii")
+magic = b"TRK1"
+
+
+class Wall():
+    # the same fields as src.game_data.Obb, without importing that file
+    def __init__(self, position, size, rotation) -> None:
+        self.position = position
+        self.size = size
+        self.rotation = rotation
+
+
+def source_hash(walls):
+    data = bytearray()
+    for wall in walls:
+        data += rect.pack(wall.position[0], wall.position[1],
+                          wall.size[0], wall.size[1])
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def compile_walls(walls):
+    # group the spans by their horizontal extent, then merge every run of
+    # rows that are exactly one row apart
+    columns = {}
+    for wall in walls:
+        if wall.size[1] != 0:
+            raise ValueError(f"wall at {wall.position} is not a scanline span")
+        key = (wall.position[0], wall.size[0])
+        columns.setdefault(key, []).append(wall.position[1])
+
+    rects = []
+    for (x, w), rows in columns.items():
+        rows.sort()
+        top = bottom = rows[0]
+        for y in rows[1:]:
+            if y == bottom + row_spacing:
+                bottom = y
+            else:
+                rects.append((x, top, w, bottom - top))
+                top = bottom = y
+        rects.append((x, top, w, bottom - top))
+
+    # same top to bottom order as the source rows
+    rects.sort(key=lambda r: (r[1], r[0]))
+    return rects
+
+
+def write_cache(path, rects):
+    with open(path, "wb") as file:
+        file.write(header.pack(magic, row_spacing, len(rects)))
+        for r in rects:
+            file.write(rect.pack(*r))
+
+
+def read_cache(path):
+    with open(path, "rb") as file:
+        data = file.read()
+    file_magic, spacing, count = header.unpack_from(data, 0)
+    if file_magic != magic or spacing != row_spacing or len(data) != header.size + count * rect.size:
+        return None
+    return list(rect.iter_unpack(data[header.size:]))
+
+
+def load_compiled_walls(walls, cache_dir=cache_dir):
+    # returns new walls, the source walls are left untouched
+    path = os.path.join(cache_dir, f"walls_{source_hash(walls)}.bin")
+    rects = None
+    if os.path.exists(path):
+        rects = read_cache(path)
+    if rects is None:
+        rects = compile_walls(walls)
+        os.makedirs(cache_dir, exist_ok=True)
+        write_cache(path, rects)
+    return [Wall([x, y], [w, h], 0) for x, y, w, h in rects]
+
+
+def main():
+    from src.game_data import walls
+    compiled = load_compiled_walls(walls)
+    print(f"{len(walls)} spans -> {len(compiled)} rectangles")
+
+
+if __name__ == "__main__":
+    main()
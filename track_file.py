@@ -0,0 +1,223 @@
+import argparse
+import mmap
+import struct
+from collections import deque
+import numpy as np
+from track_compiler import Wall, compile_walls
+
+# binary track files. one file holds everything a race needs from a track:
+# the walls as merged scanline rectangles (like track_compiler makes them),
+# the finish line, the starting grid and every ai_waypoints set. it is
+# memory mapped and the arrays are read straight from the map, so loading
+# a track is an open instead of importing a 500 line python file.
+#
+# the builder makes one from src/game_data.py, or finds the walls in the
+# track image itself: the asphalt is the grey area connected to the
+# waypoints, and on every 3rd pixel row the pixels that are not asphalt
+# but next to it, or between two bits of asphalt, become wall spans. the
+# painted finish line counts as asphalt. those walls are not the ones in
+# src/game_data.py, so the AI then drives a lap on every waypoint set to
+# make sure the track can be raced.
+#
+# python track_file.py src/tracks/racetrack.trk            from src/game_data.py
+# python track_file.py new.trk --extract --image track.png  walls from the image
+
+magic = b"TRAK"
+version = 1
+# magic, version, row spacing, scale, rectangles, grid slots, waypoint
+# sets, finish line x y w h, image name length
+header = struct.Struct("<4sIIdIII4dI")
+
+# the original track from main()
+default_image = "src/assets/racetrack.png"
+default_scale = 12
+default_finishline = [4325, 500, 40, 550]
+default_grid = [[4630, 875], [4940, 635], [5340, 875], [5760, 635]]
+
+
+def aligned(offset):
+    return (offset + 7) // 8 * 8
+
+
+def write_track(path, rects, row_spacing, scale, finishline, grid_slots, ai_waypoints, image):
+    name = image.encode()
+    lengths = np.array([len(points) for points in ai_waypoints], dtype=np.int32)
+    points = np.array([point for points in ai_waypoints for point in points],
+                      dtype=np.float64).reshape(-1, 2)
+    with open(path, "wb") as file:
+        file.write(header.pack(magic, version, row_spacing, scale, len(rects), len(grid_slots),
+                               len(ai_waypoints), *finishline, len(name)))
+        file.write(name)
+        file.write(np.array(rects, dtype=np.int32).reshape(-1, 4).tobytes())
+        file.write(lengths.tobytes())
+        # the float arrays start on 8 bytes
+        file.write(bytes(aligned(file.tell()) - file.tell()))
+        file.write(np.array(grid_slots, dtype=np.float64).reshape(-1, 2).tobytes())
+        file.write(points.tobytes())
+
+
+class TrackFile():
+    def __init__(self, path) -> None:
+        self.path = path
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (file_magic, file_version, self.row_spacing, self.scale, rect_count, grid_count, set_count,
+         x, y, w, h, name_length) = header.unpack_from(self.data)
+        if file_magic != magic or file_version != version:
+            raise ValueError(f"{path} is not a track file")
+        # a whole scale stays an int, like the old constant
+        self.scale = int(self.scale) if self.scale.is_integer() else self.scale
+        self.finishline = [x, y, w, h]
+        offset = header.size
+        self.image = bytes(self.data[offset:offset + name_length]).decode()
+        offset += name_length
+
+        def array(dtype, count, columns=1):
+            nonlocal offset
+            values = np.frombuffer(self.data, dtype=dtype, count=count * columns, offset=offset)
+            offset += values.nbytes
+            return values.reshape(-1, columns) if columns > 1 else values
+
+        # image pixels, as x, y, w, h
+        self.rects = array(np.int32, rect_count, 4)
+        lengths = array(np.int32, set_count)
+        offset = aligned(offset)
+        grid = array(np.float64, grid_count, 2)
+        points = array(np.float64, int(lengths.sum()), 2)
+
+        # small and used everywhere as plain lists, copied out once
+        self.grid_slots = grid.tolist()
+        self.ai_waypoints = []
+        start = 0
+        for length in lengths.tolist():
+            self.ai_waypoints.append([tuple(point) for point in points[start:start + length].tolist()])
+            start += length
+
+    def walls(self):
+        # new walls in image pixels, like load_compiled_walls
+        return [Wall([x, y], [w, h], 0) for x, y, w, h in self.rects.tolist()]
+
+
+def connected(mask, seeds):
+    # the pixels of `mask` that can be reached from any of the seeds
+    height, width = mask.shape
+    flat = np.ascontiguousarray(mask).ravel()
+    reached = np.zeros(height * width, dtype=bool)
+    queue = deque()
+    for x, y in seeds:
+        start = y * width + x
+        if 0 <= x < width and 0 <= y < height and flat[start] and not reached[start]:
+            reached[start] = True
+            queue.append(start)
+    while queue:
+        i = queue.popleft()
+        y, x = divmod(i, width)
+        for j, inside in ((i - 1, x > 0), (i + 1, x < width - 1), (i - width, y > 0), (i + width, y < height - 1)):
+            if inside and flat[j] and not reached[j]:
+                reached[j] = True
+                queue.append(j)
+    return reached.reshape(height, width)
+
+
+def grow(mask, radius):
+    # every pixel within `radius` of the mask
+    height, width = mask.shape
+    grown = mask.copy()
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            if dx * dx + dy * dy > radius * radius:
+                continue
+            grown[max(dy, 0):height + min(dy, 0), max(dx, 0):width + min(dx, 0)] |= \
+                mask[max(-dy, 0):height + min(-dy, 0), max(-dx, 0):width + min(-dx, 0)]
+    return grown
+
+
+def extract_spans(image, seeds, row_spacing=3, band=8, grey=12, brightness=(110, 230), markings=()):
+    # (x, y, w) wall spans from the track image, see the top of the file.
+    # seeds are image pixels on the asphalt, the waypoints work. markings
+    # are (x, y, w, h) image rectangles painted on the asphalt, like the
+    # finish line: within `band` pixels of them black, white and their
+    # blurred edges count as asphalt too
+    import pygame
+    pixels = pygame.surfarray.array3d(pygame.image.load(image)).transpose(1, 0, 2).astype(np.int32)
+    spread = pixels.max(axis=2) - pixels.min(axis=2)
+    mean = pixels.mean(axis=2)
+    surface = (spread < grey) & (mean > brightness[0]) & (mean < brightness[1])
+    for x, y, w, h in markings:
+        area = np.s_[max(int(y) - band, 0):int(y + h) + band + 1, max(int(x) - band, 0):int(x + w) + band + 1]
+        surface[area] |= spread[area] < grey * 2
+    asphalt = connected(surface, seeds)
+
+    left = np.cumsum(asphalt, axis=1) > 0
+    right = np.cumsum(asphalt[:, ::-1], axis=1)[:, ::-1] > 0
+    wall = ~asphalt & (grow(asphalt, band) | (left & right))
+
+    spans = []
+    for y in range(0, wall.shape[0], row_spacing):
+        row = np.concatenate([[False], wall[y], [False]]).astype(np.int8)
+        edges = np.flatnonzero(np.diff(row))
+        for start, end in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            spans.append((start, y, end - start))
+    return spans
+
+
+def lap_times(path, seconds=90):
+    # {waypoint set: seconds for its first full lap, or None}. one AI car
+    # per set drives alone on the track, a set that never gets around has
+    # a wall in its way
+    from car import Car, CarWorld
+    from simulation import Simulation
+    from track import Track
+    track = Track(path)
+    times = {}
+    for ai_type, points in enumerate(track.ai_waypoints):
+        if not points:
+            continue
+        world = CarWorld(capacity=1)
+        players = [Car(world, position=track.spawn_grid(1)[0], angle=-180, car_type=ai_type % 4,
+                       is_ai=True, ai_type=ai_type)]
+        simulation = Simulation(world, players, track.collider(), track.finishline, track.ai_waypoints)
+        # the first crossing starts the lap
+        ticks = simulation.lap_ticks[0]
+        while len(ticks) < 2 and simulation.tick < seconds / simulation.timestep:
+            simulation.step()
+        times[ai_type] = (ticks[1] - ticks[0]) * simulation.timestep if len(ticks) >= 2 else None
+    return times
+
+
+def main():
+    from track_compiler import row_spacing
+    from src.game_data import walls, ai_waypoints
+    parser = argparse.ArgumentParser(description="build a binary track file")
+    parser.add_argument("path")
+    parser.add_argument("--image", default=default_image)
+    parser.add_argument("--extract", action="store_true",
+                        help="find the walls in the image instead of taking them from src/game_data.py")
+    parser.add_argument("--band", type=int, default=8,
+                        help="pixels of wall next to the asphalt with --extract")
+    parser.add_argument("--scale", type=float, default=default_scale)
+    parser.add_argument("--finishline", type=float, nargs=4, default=default_finishline)
+    args = parser.parse_args()
+
+    spans = walls
+    if args.extract:
+        seeds = [(int(x / args.scale), int(y / args.scale)) for points in ai_waypoints for x, y in points]
+        finishline = [value / args.scale for value in args.finishline]
+        spans = [Wall([x, y], [w, 0], 0)
+                 for x, y, w in extract_spans(args.image, seeds, row_spacing, args.band, markings=[finishline])]
+    rects = compile_walls(spans)
+    write_track(args.path, rects, row_spacing, args.scale, args.finishline, default_grid, ai_waypoints, args.image)
+    track = TrackFile(args.path)
+    print(f"{args.path}: {len(spans)} spans -> {len(track.rects)} rectangles, "
+          f"{sum(len(points) for points in track.ai_waypoints)} waypoints in {len(track.ai_waypoints)} sets")
+    if args.extract:
+        # walls found in the image can close the track, make sure it can be raced
+        times = lap_times(args.path)
+        print("first lap: " + ", ".join(f"set {ai_type} {'none' if time is None else f'{time:.2f} s'}"
+                                        for ai_type, time in times.items()))
+        if None in times.values():
+            raise SystemExit(f"{args.path}: not every waypoint set gets around the track")
+
+
+if __name__ == "__main__":
+    main()
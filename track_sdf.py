@@ -0,0 +1,215 @@
+import hashlib
+import math
+import os
+import numpy as np
+from track_compiler import cache_dir
+from collision import WallGrid, slide_along_wall
+
+# signed distance field of the track walls. the scaled walls are drawn
+# into a grid of `cell_size` pixels and every cell gets the distance from
+# its centre to the nearest wall span, negative inside a wall, together
+# with the gradient of that distance. the grid is cached in src/cache as a
+# .npy file keyed by a hash of the walls and memory mapped, so only the
+# first start builds it.
+#
+# after that the distance and the normal of the nearest wall are one
+# bilinear lookup per car, however many walls the track has. SdfWalls is a
+# wall collision backend on top of it, with the same collide() as WallGrid
+# and NumpyWalls. it pushes a car out along the field instead of wall by
+# wall, so races are close to but not the same as with the other two.
+# query() hands out the wall rectangles like WallGrid, for ccd.py.
+#
+# run with: python track_sdf.py
+
+
+def walls_hash(walls):
+    # any track, any scale
+    data = np.array([wall.position + wall.size for wall in walls], dtype=np.float64)
+    return hashlib.sha1(data.tobytes()).hexdigest()[:16]
+
+
+def lower_envelope(f):
+    # min over j of (i - j)^2 + f[j] for every i, down every column of f,
+    # in linear time (Felzenszwalb and Huttenlocher): the parabolas that
+    # make up the lower envelope are found first, then read off in order.
+    # every column is its own envelope, all of them go at once.
+    n, columns = f.shape
+    column = np.arange(columns)
+    height = f + (np.arange(n, dtype=np.float64) ** 2)[:, None]
+    # per column: where the k-th envelope parabola sits and where it starts
+    vertex = np.zeros((n, columns), dtype=np.int64)
+    start = np.empty((n + 1, columns))
+    start[0] = -np.inf
+    start[1] = np.inf
+    k = np.zeros(columns, dtype=np.int64)
+    for q in range(1, n):
+        while True:
+            last = vertex[k, column]
+            meet = (height[q] - height[last, column]) / (2 * (q - last))
+            # parabolas that q hides from where they start are dropped
+            hidden = meet <= start[k, column]
+            if not hidden.any():
+                break
+            k -= hidden
+        k += 1
+        vertex[k, column] = q
+        start[k, column] = meet
+        start[k + 1, column] = np.inf
+
+    result = np.empty_like(f)
+    k[:] = 0
+    for q in range(n):
+        while True:
+            passed = start[k + 1, column] < q
+            if not passed.any():
+                break
+            k += passed
+        nearest = vertex[k, column]
+        result[q] = (q - nearest) ** 2 + f[nearest, column]
+    return result
+
+
+def nearest_distance(occupied):
+    # exact euclidean distance in cells from every cell to the nearest
+    # occupied one: first along the rows, then down the columns
+    rows, columns = occupied.shape
+    index = np.arange(columns)[None, :].astype(np.float64)
+    left = np.where(occupied, index, -np.inf)
+    left = np.maximum.accumulate(left, axis=1)
+    right = np.where(occupied, index, np.inf)
+    right = np.minimum.accumulate(right[:, ::-1], axis=1)[:, ::-1]
+    row = np.minimum(index - left, right - index)
+    row = np.minimum(row, rows + columns)
+    return np.sqrt(lower_envelope(row * row))
+
+
+def build_field(walls, cell_size, margin, row_spacing):
+    # (origin, grid) with the distance, x gradient and y gradient per cell
+    left = min(wall.position[0] for wall in walls) - margin
+    top = min(wall.position[1] for wall in walls) - margin
+    right = max(wall.position[0] + wall.size[0] for wall in walls) + margin
+    bottom = max(wall.position[1] + wall.size[1] for wall in walls) + margin
+    columns = math.ceil((right - left) / cell_size)
+    rows = math.ceil((bottom - top) / cell_size)
+
+    # the spans themselves, for the distance outside the walls, and the
+    # spans grown by half a row up and down so the rows of a wall join
+    # into one solid, for the inside
+    lines = np.zeros((rows, columns), dtype=bool)
+    solid = np.zeros((rows, columns), dtype=bool)
+    half = row_spacing / 2
+    for wall in walls:
+        x, y = wall.position
+        w, h = wall.size
+        x1 = math.floor((x - left) / cell_size)
+        x2 = math.floor((x + w - left) / cell_size) + 1
+        lines[math.floor((y - top) / cell_size):math.floor((y + h - top) / cell_size) + 1, x1:x2] = True
+        solid[math.floor((y - half - top) / cell_size):math.floor((y + h + half - top) / cell_size) + 1, x1:x2] = True
+
+    outside = nearest_distance(lines)
+    inside = nearest_distance(~solid) - 0.5
+    field = np.where(solid & ~lines, -inside, outside) * cell_size
+    gradient_y, gradient_x = np.gradient(field, cell_size)
+    grid = np.stack([field, gradient_x, gradient_y], axis=2).astype(np.float32)
+    return (left, top), grid
+
+
+class SignedDistanceField():
+    def __init__(self, walls, cell_size=12, row_spacing=0, margin=480, cache_dir=cache_dir) -> None:
+        # row_spacing is the distance between the spans in world pixels,
+        # row_spacing * scale for the walls of a track.Track
+        self.cell_size = cell_size
+        path = os.path.join(cache_dir, f"sdf_{walls_hash(walls)}_{cell_size}_{row_spacing}_{margin}.npy")
+        origin_path = path[:-4] + "_origin.npy"
+        if not (os.path.exists(path) and os.path.exists(origin_path)):
+            origin, grid = build_field(walls, cell_size, margin, row_spacing)
+            os.makedirs(cache_dir, exist_ok=True)
+            # other processes may be building the same file
+            for name, data in ((origin_path, np.array(origin, dtype=np.float64)), (path, grid)):
+                temporary = f"{name}.{os.getpid()}.tmp"
+                with open(temporary, "wb") as file:
+                    np.save(file, data)
+                os.replace(temporary, name)
+        self.origin = np.load(origin_path)
+        # a plain array over the mapped file, np.memmap indexing is slower
+        self.grid = np.asarray(np.load(path, mmap_mode="r"))
+        self.rows, self.columns = self.grid.shape[:2]
+        self.cells = self.grid.reshape(-1, 3)
+        self.corners = np.array([0, 1, self.columns, self.columns + 1])
+        self.inverse = 1 / cell_size
+
+    def sample(self, x, y):
+        # bilinear (distance, x gradient, y gradient) at every x, y, the four
+        # cells around every point in one gather
+        u = (np.asarray(x, dtype=np.float64) - self.origin[0]) * self.inverse - 0.5
+        v = (np.asarray(y, dtype=np.float64) - self.origin[1]) * self.inverse - 0.5
+        i = np.minimum(np.maximum(np.floor(u), 0), self.columns - 2)
+        j = np.minimum(np.maximum(np.floor(v), 0), self.rows - 2)
+        fu = np.minimum(np.maximum(u - i, 0), 1)[:, None]
+        fv = np.minimum(np.maximum(v - j, 0), 1)[:, None]
+        cells = self.cells[(j * self.columns + i).astype(np.int64)[:, None] + self.corners]
+        top = cells[:, 0] + (cells[:, 1] - cells[:, 0]) * fu
+        bottom = cells[:, 2] + (cells[:, 3] - cells[:, 2]) * fu
+        values = top + (bottom - top) * fv
+        return values[:, 0], values[:, 1], values[:, 2]
+
+    def distance(self, x, y):
+        return self.sample(x, y)[0]
+
+    def penetration(self, px, py, radius):
+        # depth and normal per car, like NumpyWalls.penetration but against
+        # the nearest wall only. depth <= 0 means no contact.
+        distance, gradient_x, gradient_y = self.sample(px, py)
+        size = np.sqrt(gradient_x * gradient_x + gradient_y * gradient_y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inverse = np.where(size > 0, 1 / size, 0)
+        return radius - distance, gradient_x * inverse, gradient_y * inverse
+
+
+class SdfWalls():
+    def __init__(self, walls, cell_size=12, row_spacing=0) -> None:
+        self.walls = walls
+        self.row_spacing = row_spacing
+        self.field = SignedDistanceField(walls, cell_size, row_spacing)
+        # made when something asks for the walls themselves
+        self.grid = None
+
+    def query(self, x, y, radius):
+        if self.grid is None:
+            self.grid = WallGrid(self.walls, row_spacing=self.row_spacing or None)
+        return self.grid.query(x, y, radius)
+
+    def collide(self, players):
+        if not players:
+            return []
+        world = players[0].world
+        rows = np.array([player.index for player in players])
+        depth, nx, ny = self.field.penetration(world.position[rows, 0], world.position[rows, 1],
+                                               world.radius[rows])
+        collided = depth > 0
+        for i in np.flatnonzero(collided):
+            player = players[i]
+            player.position[0] += nx[i] * depth[i]
+            player.position[1] += ny[i] * depth[i]
+            slide_along_wall(player, (nx[i], ny[i]))
+        return collided.tolist()
+
+    def __iter__(self):
+        return iter(self.walls)
+
+    def __len__(self):
+        return len(self.walls)
+
+
+def main():
+    import time
+    from track import get_track
+    track = get_track()
+    start = time.perf_counter()
+    field = SignedDistanceField(track.walls(), row_spacing=track.row_spacing * track.scale)
+    print(f"{field.columns}x{field.rows} cells of {field.cell_size} px, loaded in "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()